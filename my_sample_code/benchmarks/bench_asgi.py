@@ -0,0 +1,91 @@
+"""
+Requests per second and latency of the read endpoints: sync views under gunicorn (WSGI),
+the same sync views under uvicorn (ASGI) and the async views under uvicorn.
+Needs gunicorn and uvicorn installed, servers missing from the environment are skipped
+
+    python -m benchmarks.bench_asgi [requests_per_client] [clients]
+
+BENCH_CATALOGUE_CACHE=1 keeps the catalogue cache on, by default every request reaches the database
+"""
+import http.client
+import shutil
+import sys
+import threading
+import time
+
+from benchmarks.harness import setup, test_database, free_port, start_server, stop_server, percentile, print_table
+
+setup()
+
+from store.models import Product  # noqa: E402
+
+PRODUCTS = 2000
+PAGE_SIZE = 50
+SERVERS = {
+    'wsgi': ['gunicorn', 'my_sample_code.wsgi:application', '--threads', '{clients}', '--bind', '127.0.0.1:{port}'],
+    'asgi': ['uvicorn', 'my_sample_code.asgi:application', '--no-access-log', '--port', '{port}'],
+}
+SCENARIOS = (
+    ('wsgi', 'sync', '/api/v1/product/?page_size={page_size}', '/api/v1/product/{id}/'),
+    ('asgi', 'sync', '/api/v1/product/?page_size={page_size}', '/api/v1/product/{id}/'),
+    ('asgi', 'async', '/api/v1/async/product/?page_size={page_size}', '/api/v1/async/product/{id}/'),
+)
+
+
+def load(port, paths, requests_per_client, clients):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(number):
+        http_connection = http.client.HTTPConnection('127.0.0.1', port)
+        client_latencies = []
+        for request_number in range(requests_per_client):
+            path = paths[(number + request_number) % len(paths)]
+            started = time.perf_counter()
+            http_connection.request('GET', path, headers={'Accept': 'application/json'})
+            response = http_connection.getresponse()
+            response.read()
+            client_latencies.append(time.perf_counter() - started)
+            if response.status != 200:
+                raise RuntimeError(f'{path} answered {response.status}')
+        http_connection.close()
+        with lock:
+            latencies.extend(client_latencies)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) / (time.perf_counter() - started), sorted(latencies)
+
+
+def run(requests_per_client, clients):
+    Product.objects.bulk_create([Product(name=f'product_{number}', vendor_code=f'V{number}',
+                                         price=number % 1000, cost_price=number % 100, quantity=number % 50)
+                                 for number in range(PRODUCTS)])
+    product_ids = list(Product.objects.values_list('id', flat=True)[:100])
+    results = []
+    for server_name, views, list_path, detail_path in SCENARIOS:
+        if shutil.which(SERVERS[server_name][0]) is None:
+            print(f'{SERVERS[server_name][0]} is not installed, {server_name} {views} is skipped')
+            continue
+        paths = [list_path.format(page_size=PAGE_SIZE)] + [detail_path.format(id=id_) for id_ in product_ids]
+        port = free_port()
+        server = start_server([argument.format(port=port, clients=clients) for argument in SERVERS[server_name]], port)
+        try:
+            load(port, paths, 10, clients)
+            requests_per_second, latencies = load(port, paths, requests_per_client, clients)
+        finally:
+            stop_server(server)
+        results.append((server_name, views, f'{requests_per_second:.0f}',
+                        percentile(latencies, 0.5), percentile(latencies, 0.99)))
+    print_table(('server', 'views', 'requests/s', 'p50 ms', 'p99 ms'), results)
+
+
+if __name__ == '__main__':
+    # servers run in other processes, so the test database has to be a file
+    with test_database(in_file=True):
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 16)
@@ -0,0 +1,60 @@
+"""
+Cost of filling a cart line by line, one request per line, for every cart storage backend
+"""
+from benchmarks.harness import setup, test_database, stopwatch, print_table
+
+setup()
+
+from types import SimpleNamespace  # noqa: E402
+
+from django.contrib.sessions.backends.db import SessionStore  # noqa: E402
+from django.contrib.sessions.models import Session  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from store.models import Product, CartLine  # noqa: E402
+from store.utils.cart import Cart  # noqa: E402
+
+CART_SIZES = (1, 50, 500)
+BACKENDS = ('store.utils.cart.SessionCartStorage', 'store.utils.cart.DatabaseCartStorage')
+
+
+def fill_cart(products):
+    session_key = None
+    for product in products:
+        session = SessionStore(session_key)
+        Cart(SimpleNamespace(session=session)).add(
+            product={'id': product.id, 'quantity': product.quantity, 'price': product.price}, quantity_to_buy=1)
+        session.save()
+        session_key = session.session_key
+    return session_key
+
+
+def run():
+    rows = []
+    for size in CART_SIZES:
+        Product.objects.all().delete()
+        Product.objects.bulk_create([Product(name=f'product_{number}', vendor_code=f'B{number}',
+                                             price='199.99', cost_price='99.99', quantity=10)
+                                     for number in range(size)])
+        products = list(Product.objects.all())
+        for backend in BACKENDS:
+            with override_settings(CART_STORAGE_BACKEND=backend):
+                timings = {}
+                with stopwatch(timings, 'fill'):
+                    session_key = fill_cart(products)
+                session = SessionStore(session_key)
+                with stopwatch(timings, 'read'):
+                    list(Cart(SimpleNamespace(session=session)))
+                session_bytes = len(Session.objects.get(session_key=session_key).session_data)
+                rows.append((size, backend.rsplit('.', 1)[-1],
+                             f"{timings['fill'] * 1000 / size:.3f}",
+                             f"{timings['read'] * 1000:.3f}",
+                             session_bytes))
+            CartLine.objects.all().delete()
+            Session.objects.all().delete()
+    print_table(('lines', 'backend', 'ms per add', 'ms to read cart', 'session bytes'), rows)
+
+
+if __name__ == '__main__':
+    with test_database():
+        run()
@@ -0,0 +1,34 @@
+"""
+Throughput of product import, first run creates every product, second run updates them
+
+    python -m benchmarks.bench_import [rows]
+"""
+import io
+import sys
+
+from benchmarks.harness import setup, test_database, print_table
+
+setup()
+
+from store.utils.product_import import ProductImporter  # noqa: E402
+
+
+def generate_csv(rows, price):
+    lines = ['name,vendor_code,about_product,price,cost_price,quantity']
+    lines += [f'product_{number},V{number},about product {number},{price},{price / 2:.2f},{number % 100}'
+              for number in range(rows)]
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+def run(rows):
+    results = []
+    for run_name, price in (('create', 100), ('update', 120)):
+        result = ProductImporter().run(generate_csv(rows, price), 'csv')
+        results.append((run_name, result.rows, result.created, result.updated, len(result.errors),
+                        f'{result.seconds:.2f}', result.rows_per_second))
+    print_table(('run', 'rows', 'created', 'updated', 'errors', 'seconds', 'rows/s'), results)
+
+
+if __name__ == '__main__':
+    with test_database():
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
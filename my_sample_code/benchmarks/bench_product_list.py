@@ -0,0 +1,113 @@
+"""
+Product list: ModelViewSet list with ProductSerializer and JSONRenderer against the values_list() fast path
+with the row encoder and FastJSONRenderer. Pages through the whole catalogue with the biggest page,
+then times encoding and rendering of all rows at once without the database
+
+    python -m benchmarks.bench_product_list [products ...]
+"""
+import sys
+import time
+
+from benchmarks.harness import setup, test_database, print_table
+
+setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+from rest_framework.viewsets import ModelViewSet  # noqa: E402
+
+from store.models import Product  # noqa: E402
+from store.serializers import ProductSerializer  # noqa: E402
+from store.utils.renderers import FastJSONRenderer, orjson  # noqa: E402
+from store.utils.row_encoder import product_rows  # noqa: E402
+from store.views import ProductAPIViewSet  # noqa: E402
+
+BATCH_SIZE = 50000
+PAGE_SIZE = 1000
+RUNS = 3
+
+
+class SerializerProductViewSet(ProductAPIViewSet):
+    renderer_classes = [JSONRenderer]
+
+    def list(self, request, *args, **kwargs):
+        return ModelViewSet.list(self, request, *args, **kwargs)
+
+
+class JSONProductViewSet(ProductAPIViewSet):
+    renderer_classes = [JSONRenderer]
+
+
+def seed(products):
+    for start in range(0, products, BATCH_SIZE):
+        Product.objects.bulk_create([Product(name=f'product {number}', vendor_code=f'V{number}',
+                                             about_product=f'about product {number} – ünïcode',
+                                             price=number % 1000 + 0.99, cost_price=number % 100 + 0.5,
+                                             quantity=number % 50)
+                                     for number in range(start, min(start + BATCH_SIZE, products))])
+
+
+def page_through(view):
+    """
+    Bodies of all pages and seconds it took to get them
+    """
+    factory = APIRequestFactory()
+    url, bodies = f'/api/v1/product/?page_size={PAGE_SIZE}', []
+    started = time.perf_counter()
+    while url:
+        response = view(factory.get(url))
+        response.render()
+        bodies.append(response.content)
+        url = response.data['next']
+    return bodies, time.perf_counter() - started
+
+
+def best(measure):
+    results = [measure() for _ in range(RUNS)]
+    return min(results, key=lambda result: result[1])
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def run(products):
+    seed(products)
+    rows = []
+    views = [('ModelViewSet list, JSONRenderer', SerializerProductViewSet.as_view({'get': 'list'})),
+             ('values_list rows, JSONRenderer', JSONProductViewSet.as_view({'get': 'list_rows'})),
+             ('values_list rows, FastJSONRenderer', ProductAPIViewSet.as_view({'get': 'list_rows'}))]
+    baseline = None
+    for name, view in views:
+        bodies, seconds = best(lambda: page_through(view))
+        baseline = baseline or bodies
+        rows.append((products, f'endpoint: {name}', f'{seconds:.2f}', f'{products / seconds:,.0f}',
+                     'yes' if bodies == baseline else 'NO'))
+
+    instances = list(Product.objects.order_by('id'))
+    values = list(Product.objects.order_by('id').values_list(*product_rows.fields))
+    cases = [('ProductSerializer + JSONRenderer',
+              lambda: JSONRenderer().render(ProductSerializer(instances, many=True).data)),
+             ('row encoder + JSONRenderer', lambda: JSONRenderer().render(product_rows.encode(values))),
+             ('row encoder + FastJSONRenderer', lambda: FastJSONRenderer().render(product_rows.encode(values)))]
+    baseline = None
+    for name, encode in cases:
+        body, seconds = best(lambda: timed(encode))
+        baseline = baseline or body
+        rows.append((products, f'encoding: {name}', f'{seconds:.2f}', f'{products / seconds:,.0f}',
+                     'yes' if body == baseline else 'NO'))
+    Product.objects.all().delete()
+    return rows
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000]
+    results = []
+    with test_database():
+        for size in sizes:
+            results.extend(run(size))
+    if orjson is None:
+        print('orjson is not installed, FastJSONRenderer renders with json')
+    print_table(('products', 'path', 'seconds', 'rows/s', 'same bytes'), results)
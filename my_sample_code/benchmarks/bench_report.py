@@ -0,0 +1,81 @@
+"""
+Report over a year of order lines: rollup summed in SQL against order lines aggregated in SQL and with NumPy
+
+    python -m benchmarks.bench_report [order_lines]
+"""
+import datetime
+import itertools
+import sys
+
+from benchmarks.harness import setup, test_database, stopwatch, print_table
+
+setup()
+
+from django.utils import timezone  # noqa: E402
+
+from store.models import Product, Order, OrderProduct, DailyProductSales  # noqa: E402
+from store.utils.reports import Report  # noqa: E402
+
+PRODUCTS = 5000
+LINES_PER_ORDER = 5
+DAYS = 365
+BATCH_SIZE = 50000
+
+
+def seed(order_lines):
+    Product.objects.bulk_create([Product(name=f'product_{number}', vendor_code=f'V{number}',
+                                         price=number % 1000 + 0.99, cost_price=number % 100 + 0.5, quantity=100)
+                                 for number in range(PRODUCTS)], batch_size=BATCH_SIZE)
+    products = list(Product.objects.values_list('id', 'price', 'cost_price'))
+    orders = order_lines // LINES_PER_ORDER
+    for start in range(0, orders, BATCH_SIZE):
+        Order.objects.bulk_create([Order(customer_name='customer', email='test@email.com', address='street',
+                                         postal_code='123456', city='city', returned=number % 10 == 0)
+                                   for number in range(start, min(start + BATCH_SIZE, orders))])
+    order_ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+    now = timezone.now()
+    orders_per_day = len(order_ids) // DAYS + 1
+    for day in range(DAYS):
+        day_orders = order_ids[day * orders_per_day:(day + 1) * orders_per_day]
+        if day_orders:
+            created = now - datetime.timedelta(days=DAYS - day)
+            Order.objects.filter(id__gte=day_orders[0], id__lte=day_orders[-1]).update(
+                created=created, updated=created + datetime.timedelta(days=3))
+    lines = (OrderProduct(order_id=order_ids[number // LINES_PER_ORDER],
+                          product_id=product_id,
+                          quantity=number % 5 + 1,
+                          unit_price=price,
+                          unit_cost=cost_price)
+             for number, (product_id, price, cost_price) in zip(range(order_lines), itertools.cycle(products)))
+    while True:
+        batch = [line for _, line in zip(range(BATCH_SIZE), lines)]
+        if not batch:
+            break
+        OrderProduct.objects.bulk_create(batch)
+
+
+def normalized(rows):
+    # SQLite sums decimals as floats, compare to the cent
+    return [{**row, 'proceeds': round(row['proceeds'], 2), 'profit': round(row['profit'], 2)} for row in rows]
+
+
+def run(order_lines):
+    timings = {}
+    with stopwatch(timings, 'seed'):
+        seed(order_lines)
+    with stopwatch(timings, 'rollup rebuild'):
+        DailyProductSales.objects.rebuild()
+    today = timezone.localdate()
+    report = Report((today - datetime.timedelta(days=DAYS)).strftime('%d.%m.%Y'), today.strftime('%d.%m.%Y'))
+    rows = {}
+    for engine in Report.available_engines():
+        with stopwatch(timings, f'report, {engine} engine'):
+            rows[engine] = list(report.get_report_products(engine))
+    if any(normalized(engine_rows) != normalized(rows['sql']) for engine_rows in rows.values()):
+        print('Engines disagree')
+    print_table(('step', 'seconds'), [(name, f'{seconds:.2f}') for name, seconds in timings.items()])
+
+
+if __name__ == '__main__':
+    with test_database():
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,91 @@
+"""
+Product search over a large catalogue: full-text search against the icontains scan it replaced
+and exact vendor_code lookup. Times the first page of 100 products the list endpoint reads
+
+    python -m benchmarks.bench_search [products]
+"""
+import itertools
+import random
+import statistics
+import string
+import sys
+import time
+from functools import reduce
+from operator import or_
+
+from benchmarks.harness import setup, test_database, print_table
+
+setup()
+
+from django.db.models import Q  # noqa: E402
+
+from store.models import Product  # noqa: E402
+from store.utils.search import product_search  # noqa: E402
+
+BATCH_SIZE = 50000
+WORDS = 5000
+PAGE_SIZE = 100
+RUNS = 20
+
+
+def words(generator):
+    vocabulary = set()
+    while len(vocabulary) < WORDS:
+        vocabulary.add(''.join(generator.choices(string.ascii_lowercase, k=generator.randint(4, 10))))
+    return sorted(vocabulary, key=lambda word: generator.random())
+
+
+def seed(products, vocabulary):
+    generator = random.Random(0)
+    # word frequencies follow Zipf's law, like in real product names: the first word is the most common
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(WORDS)))
+    for start in range(0, products, BATCH_SIZE):
+        batch = []
+        for number in range(start, min(start + BATCH_SIZE, products)):
+            name, about = (' '.join(generator.choices(vocabulary, cum_weights=cum_weights, k=k)) for k in (3, 10))
+            batch.append(Product(name=name, about_product=about, vendor_code=f'V{number}',
+                                 price=number % 1000, cost_price=number % 100, quantity=1))
+        Product.objects.bulk_create(batch)
+
+
+def timed(queryset):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        rows = len(queryset.all()[:PAGE_SIZE + 1])
+        timings.append(time.perf_counter() - started)
+    return rows, statistics.median(timings) * 1000
+
+
+def icontains(term):
+    return Product.objects.filter(reduce(or_, (Q(**{f'{field}__icontains': term})
+                                               for field in ('name', 'price', 'cost_price')))).order_by('id')
+
+
+def searched(search):
+    return product_search.filter(Product.objects.all(), search).order_by(f'-{product_search.rank_field}', 'id')
+
+
+def run(products):
+    vocabulary = words(random.Random(1))
+    seed(products, vocabulary)
+    cases = (
+        ('vendor_code exact', Product.objects.filter(vendor_code=f'V{products // 2}')),
+        ('full-text, most common word', searched(vocabulary[0])),
+        ('full-text, common word', searched(vocabulary[50])),
+        ('full-text, rare word', searched(vocabulary[-1])),
+        ('full-text, 3 letter prefix', searched(vocabulary[10][:3])),
+        ('full-text, two words', searched(f'{vocabulary[20]} {vocabulary[200]}')),
+        ('full-text, phrase', searched(f'{vocabulary[0]}_{vocabulary[1]}')),
+        ('icontains, rare word', icontains(vocabulary[-1])),
+    )
+    rows = []
+    for name, queryset in cases:
+        found, milliseconds = timed(queryset)
+        rows.append((name, found, f'{milliseconds:.1f}'))
+    print_table(('query', 'rows', 'median ms'), rows)
+
+
+if __name__ == '__main__':
+    with test_database():
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
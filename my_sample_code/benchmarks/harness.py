@@ -0,0 +1,95 @@
+"""
+Helpers shared by benchmarks. Every benchmark runs against a throwaway test database:
+
+    python -m benchmarks.bench_cart
+"""
+import contextlib
+import os
+import socket
+import subprocess
+import tempfile
+import time
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_sample_code.settings')
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(in_file=False):
+    """
+    in_file keeps a SQLite test database in a temporary file, so servers started by the benchmark can open it
+    """
+    from django.db import connection
+    from django.test.utils import (setup_test_environment, teardown_test_environment,
+                                   setup_databases, teardown_databases)
+    with tempfile.TemporaryDirectory() as directory:
+        if in_file and connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, port=None):
+    """
+    Start a process with benchmarks.live_settings against the test database.
+    With a port, wait until the server accepts connections
+    """
+    from django.db import connection
+    environment = {**os.environ,
+                   'DJANGO_SETTINGS_MODULE': 'benchmarks.live_settings',
+                   'BENCH_DATABASE_NAME': connection.settings_dict['NAME']}
+    server = subprocess.Popen(command, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if port is None:
+        return server
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f'{command[0]} server did not start')
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
+
+
+@contextlib.contextmanager
+def stopwatch(results, name):
+    started = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - started
+
+
+def percentile(latencies, share):
+    """
+    Value of sorted latencies (seconds) below which the share of them is, in milliseconds
+    """
+    return round(latencies[min(int(len(latencies) * share), len(latencies) - 1)] * 1000, 1)
+
+
+def print_table(headers, rows):
+    """
+    Print rows in right aligned columns, floats with one decimal
+    """
+    rows = [[f'{value:.1f}' if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(value) for value in column) for column in zip(headers, *rows)]
+    for row in (headers, *rows):
+        print('  '.join(value.rjust(width) for value, width in zip(row, widths)))
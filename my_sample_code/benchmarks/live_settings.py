@@ -0,0 +1,19 @@
+"""
+Settings for servers started by benchmarks: they use the benchmark test database
+and, unless BENCH_CATALOGUE_CACHE is set, bypass the catalogue cache so every request reaches the database
+"""
+import os
+
+from my_sample_code.settings import *  # noqa: F401,F403
+from my_sample_code.settings import CACHES, DATABASES
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+# replicas are test mirrors of 'default', so they read the same database file
+for database in DATABASES.values():
+    database['NAME'] = os.environ['BENCH_DATABASE_NAME']
+QUERY_COUNT_HEADER = True
+
+if not os.environ.get('BENCH_CATALOGUE_CACHE'):
+    CACHES = {**CACHES, 'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    CATALOGUE_CACHE_LOCAL_ENTRIES = 0
@@ -0,0 +1,243 @@
+"""
+End to end load test of the checkout flow against a local server: every virtual user adds a product to its cart,
+creates an order, returns some of its orders and now and then reads the report of the last month.
+The store is seeded with seed_store first, a job worker books the rollup while the load runs.
+Prints throughput, latency percentiles and database queries per request of every step, then checks
+that no stock was oversold and that stock, client view, order lines and rollup agree
+
+    python -m benchmarks.loadtest [--users 16] [--iterations 50] [--products 200] [--orders 5000] ...
+
+--output results.json saves the numbers to compare runs before and after a change.
+Uses gunicorn when it is installed, otherwise the development server
+"""
+import argparse
+import collections
+import datetime
+import http.client
+import http.cookies
+import json
+import random
+import shutil
+import sys
+import threading
+import time
+
+from benchmarks.harness import setup, test_database, free_port, start_server, stop_server, percentile, print_table
+
+setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db.models import Max, Sum  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from store.models import Product, Order, OrderProduct, Job  # noqa: E402
+from store.utils.jobs import job_queue  # noqa: E402
+from store.utils.reports import Report  # noqa: E402
+
+STEPS = ('cart', 'order', 'refund', 'report')
+ORDER_DATA = {'customer_name': 'load test',
+              'email': 'load@test.com',
+              'address': 'load street',
+              'postal_code': '123456',
+              'city': 'load city'}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Load test of cart, order, refund and report endpoints')
+    parser.add_argument('--users', type=int, default=16, help='Concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=50, help='Checkouts made by every user')
+    parser.add_argument('--products', type=int, default=200, help='Seeded products')
+    parser.add_argument('--orders', type=int, default=5000, help='Seeded historical orders')
+    parser.add_argument('--stock', type=int, default=20, help='Stock of every seeded product')
+    parser.add_argument('--hot-products', type=int, default=10,
+                        help='Users buy only these products, fewer products mean more contention')
+    parser.add_argument('--refund-ratio', type=float, default=0.2, help='Share of created orders returned')
+    parser.add_argument('--report-every', type=int, default=10, help='Every Nth checkout also reads the report')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write results to this JSON file')
+    return parser.parse_args()
+
+
+class VirtualUser:
+    """
+    One shopper with its own connection and session cookie. Keeps what the server told it it sold and returned
+    """
+
+    def __init__(self, port, number, options, product_ids, results):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port)
+        self.random = random.Random(f'{options.seed}:{number}')
+        self.options = options
+        self.product_ids = product_ids
+        self.results = results
+        self.cookies = http.cookies.SimpleCookie()
+        self.sold = collections.Counter()
+        self.refunded = collections.Counter()
+
+    def request(self, step, method, path, data=None):
+        body = None if data is None else json.dumps(data)
+        headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={morsel.value}' for name, morsel in self.cookies.items())
+        started = time.perf_counter()
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        content = response.read()
+        self.results.record(step, time.perf_counter() - started, response.status, response.getheader('X-Query-Count'))
+        for cookie in response.headers.get_all('Set-Cookie') or ():
+            self.cookies.load(cookie)
+        if content and response.getheader('Content-Type', '').startswith('application/json'):
+            return response.status, json.loads(content)
+        return response.status, None
+
+    def run(self, date_from, date_to):
+        for iteration in range(self.options.iterations):
+            product_id = self.random.choice(self.product_ids)
+            self.request('cart', 'POST', '/api/v1/cart/',
+                         {'product_id': product_id, 'quantity_to_buy': self.random.randint(1, 3)})
+            status, content = self.request('order', 'POST', '/api/v1/order/', ORDER_DATA)
+            if status == 201:
+                for sold_product_id, line in content['selled_products'].items():
+                    self.sold[int(sold_product_id)] += line['quantity']
+                if self.random.random() < self.options.refund_ratio:
+                    status, _ = self.request('refund', 'PATCH', '/api/v1/order/',
+                                             {'order_id': content['order_data']['id']})
+                    if status == 204:
+                        for sold_product_id, line in content['selled_products'].items():
+                            self.refunded[int(sold_product_id)] += line['quantity']
+            elif status == 400:
+                # cart lines that could not be sold stay in the cart
+                self.request('cart', 'DELETE', '/api/v1/cart/', {'product_id': product_id})
+            if iteration % self.options.report_every == 0:
+                self.request('report', 'GET', f'/api/v1/report/?date_from={date_from}&date_to={date_to}')
+        self.connection.close()
+
+
+class LoadTestResults:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.queries = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+        self.seconds = 0.0
+
+    def record(self, step, seconds, status, query_count):
+        with self.lock:
+            self.latencies[step].append(seconds)
+            self.statuses[step][status] += 1
+            if query_count is not None:
+                self.queries[step].append(int(query_count))
+
+    def rows(self):
+        for step in STEPS:
+            latencies = sorted(self.latencies[step])
+            if not latencies:
+                continue
+            queries = self.queries[step]
+            yield {'step': step,
+                   'requests': len(latencies),
+                   'requests_per_second': round(len(latencies) / self.seconds, 1),
+                   'p50_ms': percentile(latencies, 0.5),
+                   'p95_ms': percentile(latencies, 0.95),
+                   'p99_ms': percentile(latencies, 0.99),
+                   'queries_avg': round(sum(queries) / len(queries), 1) if queries else None,
+                   'queries_max': max(queries) if queries else None,
+                   'statuses': dict(sorted(self.statuses[step].items()))}
+
+
+def check_consistency(stock, first_order_id, users):
+    """
+    Violations of: stock left = seeded stock - sold + returned, per product, as seen by the database,
+    by the clients and by order lines; rollup of today = order lines of today
+    """
+    violations = []
+    sold, refunded = collections.Counter(), collections.Counter()
+    for user in users:
+        sold.update(user.sold)
+        refunded.update(user.refunded)
+    lines = OrderProduct.objects.filter(order_id__gte=first_order_id)
+    kept = dict(lines.filter(order__returned=False).values_list('product').annotate(Sum('quantity')))
+    for product_id, quantity in Product.objects.filter(id__in=stock).values_list('id', 'quantity'):
+        if stock[product_id] - kept.get(product_id, 0) != quantity:
+            violations.append(f'product {product_id}: {stock[product_id]} in stock - {kept.get(product_id, 0)} '
+                              f'kept in orders != {quantity} left')
+        if kept.get(product_id, 0) > stock[product_id]:
+            violations.append(f'product {product_id}: oversold, {kept.get(product_id, 0)} sold of {stock[product_id]}')
+        if sold[product_id] - refunded[product_id] != kept.get(product_id, 0):
+            violations.append(f'product {product_id}: clients kept {sold[product_id] - refunded[product_id]}, '
+                              f'orders keep {kept.get(product_id, 0)}')
+    # jobs waiting for a retry are run now, the rollup must be complete once the queue is empty
+    Job.objects.filter(status=Job.PENDING).update(run_after=timezone.now())
+    job_queue.run_pending()
+    violations.extend(f'job {job} failed' for job in Job.objects.filter(status=Job.FAILED))
+    today = timezone.localdate().strftime('%d.%m.%Y')
+    report = Report(today, today)
+    rollup = {row['product__id']: row for row in report.get_report_products('sql')}
+    for row in report.get_report_products('lines'):
+        rollup_row = rollup.pop(row['product__id'], None)
+        if rollup_row is None or any(round(rollup_row[field], 2) != round(row[field], 2) for field in Report.fields):
+            violations.append(f'product {row["product__id"]}: rollup {rollup_row} != order lines {row}')
+    violations.extend(f'product {product_id}: rollup {row} has no order lines' for product_id, row in rollup.items())
+    return violations
+
+
+def server_command(port, users):
+    if shutil.which('gunicorn'):
+        return ['gunicorn', 'my_sample_code.wsgi:application', '--threads', str(users), '--bind', f'127.0.0.1:{port}']
+    return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+
+
+def run(options):
+    started = time.perf_counter()
+    call_command('seed_store', products=options.products, orders=options.orders, stock=options.stock,
+                 seed=options.seed)
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    product_ids = random.Random(options.seed).sample(product_ids, min(options.hot_products, len(product_ids)))
+    stock = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'quantity'))
+    first_order_id = (Order.objects.aggregate(last_id=Max('id'))['last_id'] or 0) + 1
+    today = timezone.localdate()
+    date_from, date_to = (today - datetime.timedelta(days=30)).strftime('%d.%m.%Y'), today.strftime('%d.%m.%Y')
+
+    port = free_port()
+    server = start_server(server_command(port, options.users), port)
+    worker = start_server([sys.executable, 'manage.py', 'run_worker', '--processes', '0'])
+    results = LoadTestResults()
+    users = [VirtualUser(port, number, options, product_ids, results) for number in range(options.users)]
+    try:
+        threads = [threading.Thread(target=user.run, args=(date_from, date_to)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results.seconds = time.perf_counter() - started
+    finally:
+        stop_server(server)
+        stop_server(worker)
+
+    rows = list(results.rows())
+    violations = check_consistency(stock, first_order_id, users)
+    checkouts = sum(results.statuses['order'].values())
+    print(f'{options.users} users, {checkouts} checkouts in {results.seconds:.1f}s, '
+          f'{checkouts / results.seconds:.1f} checkouts/s')
+    print_table(('step', 'requests', 'requests/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries avg', 'queries max',
+                 'statuses'),
+                [(row['step'], row['requests'], row['requests_per_second'], row['p50_ms'], row['p95_ms'],
+                  row['p99_ms'], row['queries_avg'], row['queries_max'],
+                  ' '.join(f'{status}:{count}' for status, count in row['statuses'].items())) for row in rows])
+    print(f'{len(violations)} consistency violations')
+    for violation in violations:
+        print(f'  {violation}')
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump({'options': vars(options), 'seconds': round(results.seconds, 3), 'steps': rows,
+                       'violations': violations}, output, indent=2)
+    return not violations
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    # the server and the worker run in other processes, so the test database has to be a file
+    with test_database(in_file=True):
+        success = run(arguments)
+    sys.exit(0 if success else 1)
@@ -1,3 +1,5 @@
+import os
+import tempfile
 from pathlib import Path
 
 from my_sample_code.secret_settings import *
@@ -22,6 +24,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -29,8 +32,19 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'store.middleware.PrimaryAfterWriteMiddleware',
+    'store.middleware.QueryCountMiddleware',
 ]
 
+# every database besides 'default' is its read replica: product and report reads go to one of them
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# seconds a client keeps reading from 'default' after it wrote, and cached data built after a change
+# is read from 'default', keep it above the replication lag
+DATABASE_REPLICA_LAG = 5
+
+DATABASE_ROUTERS = ['store.utils.db_routing.ReplicaRouter']
+
 ROOT_URLCONF = 'my_sample_code.urls'
 
 TEMPLATES = [
@@ -53,6 +67,62 @@ WSGI_APPLICATION = 'my_sample_code.wsgi.application'
 
 CART_SESSION_ID = 'cart'
 
+# database sessions that count bytes read and written for /metrics
+SESSION_ENGINE = 'store.utils.sessions'
+
+# 'store.utils.cart.DatabaseCartStorage' keeps carts in their own table instead of the session
+CART_STORAGE_BACKEND = 'store.utils.cart.SessionCartStorage'
+
+# Shared tier of catalogue cache, point 'default' to memcached or redis when running several processes.
+# Reports are invalidated by the worker process, so their cache is shared by every process of this host,
+# point 'reports' to memcached or redis when they run on several hosts
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'my_sample_code_reports'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+CATALOGUE_CACHE_ALIAS = 'default'
+
+CATALOGUE_CACHE_TIMEOUT = 60 * 15
+
+CATALOGUE_CACHE_LOCAL_ENTRIES = 1000
+
+REPORT_CACHE_ALIAS = 'reports'
+
+REPORT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# seconds a response to a request with Idempotency-Key header is replayed
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+# seconds a duplicate request waits for the first one before it is answered with 409
+IDEMPOTENCY_KEY_WAIT = 10
+
+# seconds after which a request that never stored its response is considered lost and its key is reused
+IDEMPOTENCY_KEY_LOCK_TIMEOUT = 60
+
+# a failed job is retried JOB_MAX_ATTEMPTS times, waiting JOB_RETRY_DELAY seconds more after every attempt
+JOB_MAX_ATTEMPTS = 5
+
+JOB_RETRY_DELAY = 30
+
+# seconds done jobs are kept before `manage.py purge_jobs` deletes them, failed jobs are kept
+JOB_RETENTION = 60 * 60 * 24 * 7
+
+# responses carry X-Query-Count and X-Query-Time headers, used by load tests
+QUERY_COUNT_HEADER = DEBUG
+
+# per route latency and SQL histograms and store counters served at /metrics
+METRICS_ENABLED = True
+
+# addresses /metrics is served to besides staff users, add the address of the Prometheus server
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
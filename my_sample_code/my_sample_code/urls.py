@@ -2,11 +2,15 @@ from django.contrib import admin
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from store import async_views
 from store.views import (ProductAPIViewSet,
                          UpdateProductEconomicDataAPIView,
                          CartAPIView,
+                         CartBulkAPIView,
                          OrderAPIView,
                          ReportAPIView,
+                         ReportCacheStatsAPIView,
+                         MetricsView,
                          )
 
 router_v1 = DefaultRouter()
@@ -18,8 +22,15 @@ urlpatterns = [
     path('api/v1/update_product_economic_data/', UpdateProductEconomicDataAPIView.as_view(),
          name='update_product_economic_data'),
     path('api/v1/cart/', CartAPIView.as_view(), name='cart'),
+    path('api/v1/cart/bulk/', CartBulkAPIView.as_view(), name='cart_bulk'),
     path('api/v1/order/', OrderAPIView.as_view(), name='order'),
     path('api/v1/report/', ReportAPIView.as_view(), name='proceeds'),
+    path('api/v1/report/cache/', ReportCacheStatsAPIView.as_view(), name='report_cache_stats'),
+    path('api/v1/async/product/', async_views.product_list, name='async_product_list'),
+    path('api/v1/async/product/<int:pk>/', async_views.product_detail, name='async_product_detail'),
+    path('api/v1/async/cart/', async_views.cart, name='async_cart'),
+    path('api/v1/async/order/', async_views.order, name='async_order'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
 urlpatterns += router_v1.urls
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin
 
-from store.models import Product, OrderProduct, Order
+from store.models import Product, OrderProduct, Order, DailyProductSales, CartLine, IdempotencyKey, Job
 
 
 @admin.register(Product)
@@ -17,3 +17,23 @@ class OrderAdmin(ModelAdmin):
 @admin.register(OrderProduct)
 class OrderProductAdmin(ModelAdmin):
     pass
+
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(ModelAdmin):
+    pass
+
+
+@admin.register(CartLine)
+class CartLineAdmin(ModelAdmin):
+    pass
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(ModelAdmin):
+    pass
+
+
+@admin.register(Job)
+class JobAdmin(ModelAdmin):
+    pass
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from store.utils.catalogue_cache import catalogue_cache
+        from store.utils.metrics import metrics
+        from store.utils.report_cache import report_cache, check_report_cache
+        from store.utils.search import create_search_triggers
+
+        metrics.collector('catalogue_cache', catalogue_cache.stats)
+        metrics.collector('report_cache', report_cache.stats)
+        checks.register(check_report_cache, checks.Tags.caches)
+        post_migrate.connect(create_search_triggers, sender=self, dispatch_uid='store_search_triggers')
@@ -0,0 +1,56 @@
+"""
+Async entry points for the hot read paths.
+
+Under ASGI Django runs every sync view through one thread shared by all sync code,
+so catalogue reads queue behind each other. These views are coroutines and run the
+read in the thread pool instead, next to the sync views which keep serving writes.
+Django 3.2 has no async ORM, so the queries themselves still run in a worker thread
+"""
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponseNotAllowed
+
+from store.views import ProductAPIViewSet, CartAPIView, OrderAPIView
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def database_sync_to_async(func):
+    """
+    Run func in the thread pool, dropping expired connections of the pool thread before
+    and after the call the same way Django does at the start and the end of a request
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def async_read_view(view):
+    """
+    Serve safe methods of a sync DRF view from a coroutine, the response is rendered in the pool thread too
+    """
+    def read(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    read = database_sync_to_async(read)
+
+    async def async_view(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return HttpResponseNotAllowed(SAFE_METHODS)
+        return await read(request, *args, **kwargs)
+
+    async_view.csrf_exempt = True
+    return async_view
+
+
+product_list = async_read_view(ProductAPIViewSet.as_view({'get': 'list'}))
+product_detail = async_read_view(ProductAPIViewSet.as_view({'get': 'retrieve'}))
+cart = async_read_view(CartAPIView.as_view())
+order = async_read_view(OrderAPIView.as_view())
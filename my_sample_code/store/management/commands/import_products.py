@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.utils.product_import import ProductImporter
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from CSV or NDJSON file, matching them on vendor_code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, '-' reads standard input")
+        parser.add_argument('--format', dest='data_format', choices=ProductImporter.formats,
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['data_format'] or path.rsplit('.', 1)[-1].lower()
+        if data_format not in ProductImporter.formats:
+            raise CommandError('Can not tell file format, use --format')
+        importer = ProductImporter(batch_size=options['batch_size'])
+        if path == '-':
+            result = importer.run(sys.stdin.buffer, data_format)
+        else:
+            try:
+                with open(path, 'rb') as stream:
+                    result = importer.run(stream, data_format)
+            except OSError as error:
+                raise CommandError(error)
+        for error in result.errors:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.rows} rows, {result.created} created, {result.updated} updated, '
+            f'{len(result.errors)} errors in {result.seconds:.1f}s ({result.rows_per_second} rows/s)'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys whose responses are no longer replayed'
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyKey.objects.purge()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Delete jobs done more than JOB_RETENTION seconds ago'
+
+    def handle(self, *args, **options):
+        deleted = Job.objects.purge(settings.JOB_RETENTION)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} finished jobs'))
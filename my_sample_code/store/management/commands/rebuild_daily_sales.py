@@ -0,0 +1,23 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import DailyProductSales
+
+
+class Command(BaseCommand):
+    help = 'Backfill or rebuild daily product sales rollup from order lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', help="First day to rebuild, 'dd.mm.YYYY'")
+        parser.add_argument('--date-to', help="Last day to rebuild, 'dd.mm.YYYY'")
+
+    def handle(self, *args, **options):
+        try:
+            day_from, day_to = (datetime.datetime.strptime(options[name], '%d.%m.%Y').date()
+                                if options[name] else None
+                                for name in ('date_from', 'date_to'))
+        except ValueError as error:
+            raise CommandError(error)
+        rows = DailyProductSales.objects.rebuild(day_from, day_to)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily product sales rows'))
@@ -0,0 +1,63 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+
+# pool workers started with spawn or forkserver import this module before django.setup(),
+# so nothing importing models may be imported at module level
+
+
+def setup_worker():
+    django.setup()
+    # a forked process must not share database connections of the parent
+    connections.close_all()
+
+
+def work(burst, poll_interval):
+    from store.utils.jobs import job_queue
+
+    ran = 0
+    while True:
+        try:
+            ran_job = job_queue.run_next()
+        except DatabaseError:
+            # lock contention or lost connection, the job stays pending for the next attempt
+            logger.exception('Worker failed to run a job')
+            connections.close_all()
+            time.sleep(poll_interval)
+            continue
+        if ran_job:
+            ran += 1
+        elif burst:
+            return ran
+        else:
+            time.sleep(poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Run queued jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                            help='Number of worker processes, 0 runs jobs in this process')
+        parser.add_argument('--burst', action='store_true', help='Exit when no job is due')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait before looking for new jobs when none is due')
+
+    def handle(self, *args, **options):
+        processes, burst, poll_interval = options['processes'], options['burst'], options['poll_interval']
+        if processes < 1:
+            ran = work(burst, poll_interval)
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=processes, initializer=setup_worker) as pool:
+                futures = [pool.submit(work, burst, poll_interval) for _ in range(processes)]
+                ran = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.utils.store_seed import StoreSeeder
+
+
+class Command(BaseCommand):
+    help = 'Generate products and a history of orders for load tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=365, help='Orders are spread over this many days before today')
+        parser.add_argument('--lines-per-order', type=int, default=3)
+        parser.add_argument('--refund-ratio', type=float, default=0.05, help='Share of orders that were returned')
+        parser.add_argument('--stock', type=int, default=1000, help='Quantity of every product in stock')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed generates the same data')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if min(options['products'], options['orders'], options['stock']) < 0 or \
+                min(options['days'], options['lines_per_order'], options['batch_size']) < 1:
+            raise CommandError('Counts must not be negative, days, lines per order and batch size must be positive')
+        if not 0 <= options['refund_ratio'] <= 1:
+            raise CommandError('Refund ratio must be between 0 and 1')
+        result = StoreSeeder(seed=options['seed'], batch_size=options['batch_size']).run(
+            options['products'], options['orders'], days=options['days'],
+            lines_per_order=options['lines_per_order'], refund_ratio=options['refund_ratio'], stock=options['stock'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.products} products, {result.orders} orders ({result.returned_orders} returned), '
+            f'{result.order_lines} order lines in {result.seconds:.1f}s'))
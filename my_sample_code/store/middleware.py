@@ -0,0 +1,95 @@
+import contextlib
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from store.utils.db_routing import replica_routing
+from store.utils.metrics import metrics
+
+
+class QueryCountMiddleware:
+    """
+    Adds X-Query-Count and X-Query-Time (ms) headers with database queries run while the response was built.
+    Queries of a streamed body run later and are not counted. Used when QUERY_COUNT_HEADER setting is on
+    """
+    count_header = 'X-Query-Count'
+    time_header = 'X-Query-Time'
+
+    def __init__(self, get_response):
+        if not settings.QUERY_COUNT_HEADER:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = self.get_response(request)
+        response[self.count_header] = str(counter.count)
+        response[self.time_header] = f'{counter.seconds * 1000:.1f}'
+        return response
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL queries and status class of every request per route and method for /metrics.
+    Put it first, so session saving and other middleware are measured too. Used when METRICS_ENABLED setting is on
+    """
+    methods = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+        match = request.resolver_match
+        # unknown routes and methods share one label, so clients can not add series
+        route = metrics.route(match.view_name if match else 'unmatched',
+                              request.method if request.method in self.methods else 'other')
+        route.observe(seconds, counter.count, counter.seconds, response.status_code)
+        return response
+
+
+class PrimaryAfterWriteMiddleware:
+    """
+    After a request with an unsafe method the client reads from 'default' for DATABASE_REPLICA_LAG seconds,
+    so it sees its own writes. Used when DATABASE_REPLICAS are configured
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            replica_routing.pin(response)
+        return response
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.5 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+def create_name_trigram_index(apps, schema_editor):
+    """
+    SearchFilter looks names up with UPPER(name) LIKE UPPER('%...%'), only a trigram
+    index on the same expression can serve it. Postgres only
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS product_name_trgm_idx '
+                          'ON store_product USING gin (UPPER(name) gin_trgm_ops)')
+
+
+def drop_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_daily_product_sales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailyproductsales',
+            index=models.Index(fields=['day', 'product'], name='daily_sales_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated'], name='order_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('returned', True)), fields=['updated'], name='order_returned_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['cost_price', 'id'], name='product_cost_price_idx'),
+        ),
+        migrations.RunPython(create_name_trigram_index, drop_name_trigram_index),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, transaction
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_unit_prices(apps, schema_editor):
+    """
+    Value lines sold before prices were kept on them with current product prices. Every batch is
+    its own short transaction, so only the rows of one batch are locked at a time
+    """
+    OrderProduct = apps.get_model('store', 'OrderProduct')
+    Product = apps.get_model('store', 'Product')
+    products = Product.objects.filter(id=OuterRef('product_id'))
+    last_id = 0
+    while True:
+        batch = list(OrderProduct.objects.filter(id__gt=last_id, unit_price__isnull=True)
+                     .order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not batch:
+            break
+        with transaction.atomic():
+            OrderProduct.objects.filter(id__in=batch).update(
+                unit_price=Subquery(products.values('price')[:1]),
+                unit_cost=Subquery(products.values('cost_price')[:1]))
+        last_id = batch[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0007_order_product_unit_prices'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_unit_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+import store.utils.search
+
+POSTGRESQL_FORWARD = (
+    # stored generated column, Postgres keeps it up to date on every insert and update of the row
+    "ALTER TABLE store_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(about_product, '')), 'B')) STORED",
+    'CREATE INDEX product_search_vector_idx ON store_product USING gin (search_vector)',
+)
+POSTGRESQL_REVERSE = (
+    'DROP INDEX IF EXISTS product_search_vector_idx',
+    'ALTER TABLE store_product DROP COLUMN IF EXISTS search_vector',
+)
+# external content FTS5 table: it keeps only the index, rows are read from store_product.
+# Triggers fire only when name or about_product change, stock updates do not touch the index.
+# SQLite rebuilds a table altered by a migration, which drops its triggers: a post_migrate receiver
+# (store.utils.search.create_search_triggers) recreates them
+SQLITE_FORWARD = (
+    # prefix indexes make prefix terms of up to 4 characters a lookup instead of a merge of every longer word
+    "CREATE VIRTUAL TABLE store_product_fts USING fts5("
+    "name, about_product, content='store_product', content_rowid='id', prefix='2 3 4')",
+    # matches in name weigh ten times more than matches in about_product
+    "INSERT INTO store_product_fts (store_product_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    'CREATE TRIGGER store_product_fts_insert AFTER INSERT ON store_product BEGIN '
+    'INSERT INTO store_product_fts (rowid, name, about_product) VALUES (new.id, new.name, new.about_product); '
+    'END',
+    'CREATE TRIGGER store_product_fts_delete AFTER DELETE ON store_product BEGIN '
+    "INSERT INTO store_product_fts (store_product_fts, rowid, name, about_product) "
+    "VALUES ('delete', old.id, old.name, old.about_product); "
+    'END',
+    'CREATE TRIGGER store_product_fts_update AFTER UPDATE OF name, about_product ON store_product BEGIN '
+    "INSERT INTO store_product_fts (store_product_fts, rowid, name, about_product) "
+    "VALUES ('delete', old.id, old.name, old.about_product); "
+    'INSERT INTO store_product_fts (rowid, name, about_product) VALUES (new.id, new.name, new.about_product); '
+    'END',
+    "INSERT INTO store_product_fts (store_product_fts) VALUES ('rebuild')",
+)
+SQLITE_REVERSE = (
+    'DROP TRIGGER IF EXISTS store_product_fts_insert',
+    'DROP TRIGGER IF EXISTS store_product_fts_delete',
+    'DROP TRIGGER IF EXISTS store_product_fts_update',
+    'DROP TABLE IF EXISTS store_product_fts',
+)
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_backfill_order_product_unit_prices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='store.product')),
+                ('name', models.TextField()),
+                ('about_product', models.TextField()),
+                ('document', store.utils.search.SearchDocumentField(db_column='store_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'store_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(run_for_vendor({'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+                             run_for_vendor({'postgresql': POSTGRESQL_REVERSE, 'sqlite': SQLITE_REVERSE})),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.5 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_idempotency_key_client'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created'], name='order_created_idx'),
+        ),
+    ]
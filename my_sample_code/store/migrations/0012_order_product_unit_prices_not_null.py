@@ -0,0 +1,27 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+# lines written by servers still running the code before 0007 after the first backfill
+backfill_unit_prices = import_module('store.migrations.0008_backfill_order_product_unit_prices').backfill_unit_prices
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_order_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_unit_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderproduct',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='orderproduct',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+    ]
@@ -1,4 +1,95 @@
+import datetime
+
+from django.contrib.sessions.models import Session
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
+from django.db.models import Case, Exists, ExpressionWrapper, F, OuterRef, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from store.utils.catalogue_cache import catalogue_cache
+from store.utils.metrics import metrics
+from store.utils.report_cache import report_cache
+from store.utils.search import SearchDocumentField
+
+
+def line_amount(price_field):
+    return ExpressionWrapper(F('quantity') * F(price_field), output_field=models.DecimalField())
+
+
+class StockReservationError(Exception):
+    """
+    Raised when the guarded stock update touched fewer rows than were checked
+    """
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def reserve(self, quantities):
+        """
+        Remove requested quantities ({product_id: quantity}) from stock with one
+        conditional UPDATE. Rows are locked in product id order, so concurrent
+        checkouts can not deadlock on each other.
+        Return reserved quantities and the stock left for every line that can not be sold
+        """
+        if not quantities:
+            return {}, {}
+        with transaction.atomic():
+            in_stock = dict(self.select_for_update()
+                            .filter(id__in=quantities)
+                            .order_by('id')
+                            .values_list('id', 'quantity'))
+            reserved = {}
+            shortages = {}
+            for product_id, quantity in quantities.items():
+                if in_stock.get(product_id, 0) >= quantity:
+                    reserved[product_id] = quantity
+                else:
+                    shortages[product_id] = in_stock.get(product_id, 0)
+            if reserved:
+                requested = Case(*[When(id=product_id, then=Value(quantity))
+                                   for product_id, quantity in reserved.items()],
+                                 output_field=models.PositiveIntegerField())
+                updated = self.filter(id__in=reserved, quantity__gte=requested).update(
+                    quantity=F('quantity') - requested)
+                if updated != len(reserved):
+                    raise StockReservationError(f'Reserved {updated} of {len(reserved)} products')
+                catalogue_cache.invalidate(reserved)
+        return reserved, shortages
+
+    def restock(self, quantities):
+        """
+        Return quantities ({product_id: quantity}) to stock with one UPDATE.
+        Rows are locked in the same order as in reserve()
+        """
+        if not quantities:
+            return 0
+        with transaction.atomic():
+            # evaluate the locking query, the rows themselves are not needed
+            list(self.select_for_update().filter(id__in=quantities).order_by('id').values_list('id'))
+            returned = Case(*[When(id=product_id, then=Value(quantity))
+                              for product_id, quantity in quantities.items()],
+                            output_field=models.PositiveIntegerField())
+            updated = self.filter(id__in=quantities).update(quantity=F('quantity') + returned)
+            catalogue_cache.invalidate(quantities)
+        return updated
+
+    def update_economic_data(self, changes):
+        """
+        Apply changes ([{'id': ..., 'quantity'?, 'price'?, 'cost_price'?}]) writing only supplied fields,
+        with one bulk_update per set of supplied fields
+        """
+        merged = {}
+        for change in changes:
+            merged.setdefault(change['id'], {}).update(change)
+        by_fields = {}
+        for change in merged.values():
+            by_fields.setdefault(tuple(sorted(change.keys() - {'id'})), []).append(Product(**change))
+        with transaction.atomic():
+            for fields, products in by_fields.items():
+                if fields:
+                    self.bulk_update(products, fields, batch_size=500)
+        catalogue_cache.invalidate(merged)
 
 
 class Product(models.Model):
@@ -9,9 +100,77 @@ class Product(models.Model):
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Product cost price')
     quantity = models.PositiveIntegerField(verbose_name='Qantity of product', default=0)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['cost_price', 'id'], name='product_cost_price_idx'),
+        ]
+
     def __str__(self):
         return f'ID {self.id}: {self.name}'
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        catalogue_cache.invalidate([self.id])
+
+    def delete(self, *args, **kwargs):
+        product_id = self.id
+        deleted = super().delete(*args, **kwargs)
+        catalogue_cache.invalidate([product_id])
+        return deleted
+
+
+class ProductSearchIndex(models.Model):
+    """
+    SQLite FTS5 index of product name and about_product, filled by triggers on store_product.
+    Searches join it to products, rank is bm25 with name weighing more. Postgres searches a tsvector column instead
+    """
+    product = models.OneToOneField(Product, primary_key=True, db_column='rowid', related_name='search_index',
+                                   on_delete=models.DO_NOTHING)
+    name = models.TextField()
+    about_product = models.TextField()
+    document = SearchDocumentField(db_column='store_product_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'store_product_fts'
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def cancel(self):
+        """
+        Return products of all not yet returned orders to stock, mark these orders as returned
+        and enqueue orders_returned job. Takes the same number of queries for one order and for thousands of them.
+        Return ids of orders returned by this call
+        """
+        with transaction.atomic():
+            order_ids = list(self.select_for_update()
+                             .filter(returned=False)
+                             .order_by('id')
+                             .values_list('id', flat=True))
+            if not order_ids:
+                return []
+            refunds = (OrderProduct.objects.filter(order__in=order_ids)
+                       .values('product')
+                       .annotate(total=Sum('quantity'),
+                                 proceeds=Sum(line_amount('unit_price')),
+                                 cost=Sum(line_amount('unit_cost'))))
+            refunds = {item['product']: item for item in refunds}
+            Product.objects.restock({product_id: item['total'] for product_id, item in refunds.items()})
+            now = timezone.now()
+            Order.objects.filter(id__in=order_ids).update(returned=True, updated=now)
+            report_cache.invalidate([timezone.localdate(now)])
+            Job.objects.enqueue('orders_returned', order_ids=order_ids, day=timezone.localdate(now), sales={
+                product_id: (0, item['total'], -item['proceeds'], -item['cost'])
+                for product_id, item in refunds.items()})
+            transaction.on_commit(lambda: metrics.inc('store_orders_refunded_total', len(order_ids)))
+        return order_ids
+
 
 class Order(models.Model):
     customer_name = models.CharField(max_length=100)
@@ -23,76 +182,239 @@ class Order(models.Model):
     updated = models.DateTimeField(auto_now=True)
     returned = models.BooleanField(default=False)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created'], name='order_created_idx'),
+            models.Index(fields=['updated'], name='order_updated_idx'),
+            models.Index(fields=['updated'], condition=models.Q(returned=True), name='order_returned_updated_idx'),
+        ]
+
     def __str__(self):
         return f'Order {self.id}'
 
-    def remove_items_from_stock(self, product, quantity_to_remove):
+    def cancel_order(self):
         """
-        Remove requested quantity of product from stock when order created
+        Cancel this order, already returned order is left as is
         """
-        if product.quantity >= quantity_to_remove:
-            product.quantity -= quantity_to_remove
-            product.save()
-            return True
-        return False
+        return bool(Order.objects.filter(id=self.id).cancel())
+
 
-    def return_items_to_stock(self, product, quantity_to_return):
+class OrderProduct(models.Model):
+    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='order_items', on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField(default=1)
+    # price and cost price of one product at the moment of sale
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f'{self.id}'
+
+
+class DailyProductSalesQuerySet(models.QuerySet):
+
+    def record(self, day, sales):
         """
-        Return products to stock when order has been returned
+        Add sales ({product_id: (sold, refunded, proceeds, cost)}) to rollup rows of the day.
+        Takes two queries whatever the number of products
         """
-        product.quantity += quantity_to_return
-        product.save()
+        if not sales:
+            return
+        report_cache.invalidate([day])
+        self.bulk_create([DailyProductSales(product_id=product_id, day=day) for product_id in sales],
+                         ignore_conflicts=True)
 
-    @transaction.atomic
-    def add_products_from_cart_to_order(self, cart, order):
-        """
-        Add products from cart to order when we can sell requested quantity
-        """
-        selled_products = {}
-        not_selled_products = {}
-        order_products_to_create = []
-        for item in cart:
-            product_to_add, quantity_to_add = map(item.get, ('product', 'quantity'))
-            total_price_to_add = cart.get_product_total_price(product_to_add)
-            enough_quantiy_of_product = self.remove_items_from_stock(product_to_add, quantity_to_add)
-            if enough_quantiy_of_product:
-                order_products_to_create.append(OrderProduct(order=order,
-                                                             product=product_to_add,
-                                                             quantity=quantity_to_add,
-                                                             ))
-                selled_products[product_to_add.id] = {'quantity': quantity_to_add,
-                                                      'total_price': total_price_to_add}
-            else:
-                not_selled_products[product_to_add.id] = int(product_to_add.quantity)
-        OrderProduct.objects.bulk_create(order_products_to_create)
-        return selled_products, not_selled_products
-
-    def can_be_ordered(self, selled_products, not_selled_products):
-        """
-        Check order is not empty
-        """
-        if len(not_selled_products) > 0 and len(selled_products) == 0:
-            return True
-        return False
+        def per_product(position, output_field):
+            return Case(*[When(product_id=product_id, then=Value(values[position]))
+                          for product_id, values in sales.items()],
+                        output_field=output_field)
+
+        amount_field = DailyProductSales._meta.get_field('proceeds')
+        self.filter(day=day, product__in=sales).update(
+            sold=F('sold') + per_product(0, models.IntegerField()),
+            refunded=F('refunded') + per_product(1, models.IntegerField()),
+            proceeds=F('proceeds') + per_product(2, amount_field),
+            cost=F('cost') + per_product(3, amount_field),
+        )
 
     @transaction.atomic
-    def cancel_order(self, request):
+    def rebuild(self, day_from=None, day_to=None):
         """
-        Cancel sellected order
+        Recalculate rollup rows from order lines, for all days or for days in [day_from, day_to].
+        Sales are booked on the day order was created, refunds on the day it was returned,
+        both valued with prices the lines were sold at
         """
-        order_id = request.data.get('order_id')
-        order_products = OrderProduct.objects.filter(order=order_id).all()
-        order = Order.objects.get(id=order_id)
-        for item in order_products:
-            self.return_items_to_stock(item.product, item.quantity)
-        order.returned = True
-        order.save()
+        rows = self.all()
+        sold_lines = OrderProduct.objects.annotate(day=TruncDate('order__created'))
+        refunded_lines = OrderProduct.objects.filter(order__returned=True).annotate(day=TruncDate('order__updated'))
+        if day_from is not None:
+            rows = rows.filter(day__gte=day_from)
+            sold_lines = sold_lines.filter(day__gte=day_from)
+            refunded_lines = refunded_lines.filter(day__gte=day_from)
+        if day_to is not None:
+            rows = rows.filter(day__lte=day_to)
+            sold_lines = sold_lines.filter(day__lte=day_to)
+            refunded_lines = refunded_lines.filter(day__lte=day_to)
+        rows.delete()
+        report_cache.invalidate_all()
 
+        rollup = {}
+        for lines, sign in ((sold_lines, 1), (refunded_lines, -1)):
+            lines = lines.values('day', 'product').annotate(total=Sum('quantity'),
+                                                            proceeds=Sum(line_amount('unit_price')),
+                                                            cost=Sum(line_amount('unit_cost')))
+            for line in lines.iterator():
+                key = (line['day'], line['product'])
+                row = rollup.setdefault(key, DailyProductSales(day=key[0], product_id=key[1]))
+                if sign > 0:
+                    row.sold += line['total']
+                else:
+                    row.refunded += line['total']
+                row.proceeds += sign * line['proceeds']
+                row.cost += sign * line['cost']
+        self.bulk_create(rollup.values(), batch_size=1000)
+        return len(rollup)
 
-class OrderProduct(models.Model):
-    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, related_name='order_items', on_delete=models.PROTECT)
-    quantity = models.PositiveIntegerField(default=1)
+
+class DailyProductSales(models.Model):
+    """
+    Sales of product per day, kept up to date by order creation and refund
+    """
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.CASCADE)
+    day = models.DateField()
+    sold = models.IntegerField(default=0)
+    refunded = models.IntegerField(default=0)
+    proceeds = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = DailyProductSalesQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='unique_product_day_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'product'], name='daily_sales_day_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.id}'
+        return f'{self.day}: {self.product_id}'
+
+
+class CartLineQuerySet(models.QuerySet):
+
+    def purge(self):
+        """
+        Delete lines of sessions that no longer exist, return the number of deleted lines
+        """
+        deleted, _ = self.filter(~Exists(Session.objects.filter(session_key=OuterRef('session_key')))).delete()
+        return deleted
+
+
+class CartLine(models.Model):
+    """
+    Cart line of DatabaseCartStorage
+    """
+    session_key = models.CharField(max_length=40)
+    product = models.ForeignKey(Product, related_name='cart_lines', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    price_cents = models.BigIntegerField()
+
+    objects = CartLineQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session_key', 'product'], name='unique_session_cart_line'),
+        ]
+
+    def __str__(self):
+        return f'{self.session_key}: {self.product_id}'
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+
+    def purge(self):
+        """
+        Delete keys past their expiry, return the number of deleted keys
+        """
+        deleted, _ = self.filter(expires__lte=timezone.now()).delete()
+        return deleted
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response to a request sent with Idempotency-Key header, replayed when the same client retries the request.
+    Response status is empty while the first request is still being handled
+    """
+    client = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True)
+    created = models.DateTimeField()
+    expires = models.DateTimeField()
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'key'], name='unique_client_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires'], name='idempotency_key_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.client}: {self.key}'
+
+
+class JobQuerySet(models.QuerySet):
+
+    def enqueue(self, name, **payload):
+        """
+        Add job to the queue. Called inside a transaction the job is committed or rolled back with it
+        """
+        return self.create(name=name, payload=payload, run_after=timezone.now())
+
+    def due(self):
+        return self.filter(status=Job.PENDING, run_after__lte=timezone.now()).order_by('id')
+
+    def purge(self, older_than):
+        """
+        Delete jobs done more than older_than seconds ago, return the number of deleted jobs.
+        Failed jobs are kept to be looked into
+        """
+        finished_before = timezone.now() - datetime.timedelta(seconds=older_than)
+        deleted, _ = self.filter(status=Job.DONE, finished__lt=finished_before).delete()
+        return deleted
+
+
+class Job(models.Model):
+    """
+    Work done by `manage.py run_worker` after the request that enqueued it
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = ((PENDING, 'Pending'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField()
+    finished = models.DateTimeField(null=True, blank=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} {self.id}'
@@ -1,4 +1,4 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ModelSerializer, Serializer, ListField, IntegerField
 
 from store.models import Product, Order
 
@@ -9,13 +9,40 @@ class ProductSerializer(ModelSerializer):
         fields = '__all__'
 
 
+class ProductImportSerializer(ProductSerializer):
+    """
+    Same rules as ProductSerializer, but existing vendor_code is not an error: that product is updated
+    """
+    class Meta(ProductSerializer.Meta):
+        fields = ('name', 'vendor_code', 'about_product', 'price', 'cost_price', 'quantity')
+        extra_kwargs = {'vendor_code': {'validators': []}}
+
+
 class ProductEconomicDataSerializer(ModelSerializer):
+    id = IntegerField()
+
     class Meta:
         model = Product
         fields = ('id', 'quantity', 'price', 'cost_price')
+        extra_kwargs = {'quantity': {'required': False, 'min_value': 0},
+                        'price': {'required': False},
+                        'cost_price': {'required': False}}
 
 
 class OrderSerializer(ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+
+
+class OrderRefundSerializer(Serializer):
+    order_ids = ListField(child=IntegerField(), allow_empty=False)
+
+
+class CartLineSerializer(Serializer):
+    product_id = IntegerField()
+    quantity_to_buy = IntegerField(min_value=1)
+
+
+class CartBulkSerializer(Serializer):
+    lines = CartLineSerializer(many=True, allow_empty=False)
@@ -0,0 +1,66 @@
+import json
+
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+
+from store.models import Product
+from store.utils.catalogue_cache import catalogue_cache
+
+
+class AsyncReadViewsTestCase(APITransactionTestCase):
+    """
+    Async views read from a pool thread with its own connection, so the data must be committed
+    """
+
+    def setUp(self):
+        cache.clear()
+        catalogue_cache.local.clear()
+        self.product1 = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                               price=100, cost_price=10, quantity=10)
+        self.product2 = Product.objects.create(name='test_product_2', vendor_code='A2',
+                                               price=200, cost_price=20, quantity=20)
+
+    def test_product_list_matches_sync_view(self):
+        for query in ({}, {'ordering': '-price'}, {'search': 'product_2'}, {'page_size': 1}):
+            with self.subTest(query=query):
+                sync_response = self.client.get(reverse('product-list'), query)
+                async_response = self.client.get(reverse('async_product_list'), query)
+                self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+                self.assertEqual(json.loads(async_response.content)['results'],
+                                 json.loads(sync_response.content)['results'])
+
+    def test_product_detail(self):
+        response = self.client.get(reverse('async_product_detail', args=(self.product2.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['vendor_code'], 'A2')
+        response = self.client.get(reverse('async_product_detail', args=(self.product2.id,)),
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_negative_product_detail_not_found(self):
+        response = self.client.get(reverse('async_product_detail', args=(0,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cart_and_order(self):
+        self.client.post(reverse('cart'), data={'product_id': self.product1.id, 'quantity_to_buy': 2}, format='json')
+        response = self.client.get(reverse('async_cart'))
+        self.assertEqual(json.loads(response.content), {str(self.product1.id): {'quantity': 2, 'price': '100.00'}})
+
+        response = self.client.get(reverse('async_order'))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.post(reverse('order'), data={'customer_name': 'test_name',
+                                                 'email': 'test@email.com',
+                                                 'address': 'test street',
+                                                 'postal_code': 123456,
+                                                 'city': 'test_city'}, format='json')
+        response = self.client.get(reverse('async_order'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['order']['customer_name'], 'test_name')
+
+    def test_negative_write_methods_not_allowed(self):
+        response = self.client.post(reverse('async_cart'),
+                                    data={'product_id': self.product1.id, 'quantity_to_buy': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(self.client.get(reverse('cart')).json(), {})
@@ -0,0 +1,95 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management import call_command
+from django.test import TestCase
+
+from store.models import Product, CartLine
+from store.utils.cart import Cart, DatabaseCartStorage
+from store.utils.sessions import SessionStore
+
+
+class SessionCartStorageTestCase(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                              price='100.50', cost_price=10, quantity=10)
+        self.request = SimpleNamespace(session=SessionBase())
+
+    def test_lines_are_stored_compact(self):
+        cart = Cart(self.request)
+        cart.add(product={'id': self.product.id, 'quantity': 10, 'price': '100.50'}, quantity_to_buy=2)
+        self.assertEqual(self.request.session[settings.CART_SESSION_ID], {str(self.product.id): [2, 10050]})
+        self.assertEqual(cart.as_dict(), {str(self.product.id): {'quantity': 2, 'price': '100.50'}})
+
+    def test_legacy_lines_are_converted(self):
+        self.request.session[settings.CART_SESSION_ID] = {str(self.product.id): {'quantity': 3, 'price': '100.50'}}
+        cart = Cart(self.request)
+        self.assertEqual(len(cart), 3)
+        self.assertEqual(self.request.session[settings.CART_SESSION_ID], {str(self.product.id): [3, 10050]})
+
+    def test_add_after_clear(self):
+        cart = Cart(self.request)
+        cart.add(product={'id': self.product.id, 'quantity': 10, 'price': '100.50'}, quantity_to_buy=2)
+        cart.clear()
+        cart.add(product={'id': self.product.id, 'quantity': 10, 'price': '100.50'}, quantity_to_buy=1)
+        self.assertEqual(self.request.session[settings.CART_SESSION_ID], {str(self.product.id): [1, 10050]})
+
+    def test_hydrate_once(self):
+        cart = Cart(self.request)
+        cart.add(product={'id': self.product.id, 'quantity': 10, 'price': '100.50'}, quantity_to_buy=2)
+        with self.assertNumQueries(1):
+            lines = list(cart)
+            list(cart)
+            total_price = cart.get_total_price()
+        self.assertEqual(lines, [{'product': self.product, 'quantity': 2,
+                                  'price': Decimal('100.50'), 'total_price': Decimal('201.00')}])
+        self.assertEqual(total_price, Decimal('201.00'))
+
+    def test_stale_prices(self):
+        cart = Cart(self.request)
+        cart.add(product={'id': self.product.id, 'quantity': 10, 'price': '100.50'}, quantity_to_buy=2)
+        self.assertEqual(cart.get_stale_prices(), {})
+        self.product.price = '120.00'
+        self.product.save()
+        cart = Cart(self.request)
+        self.assertEqual(cart.get_stale_prices(), {self.product.id: {'cart_price': '100.50', 'price': '120.00'}})
+
+
+class DatabaseCartStorageTestCase(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                              price='100.50', cost_price=10, quantity=10)
+        self.session = SessionStore()
+        self.session.create()
+        self.request = SimpleNamespace(session=self.session)
+
+    def lines(self):
+        return list(CartLine.objects.values_list('session_key', 'product_id', 'quantity', 'price_cents'))
+
+    def test_concurrent_add_of_one_line(self):
+        # both requests of a double click read the cart before either of them wrote the line
+        first, second = DatabaseCartStorage(self.request), DatabaseCartStorage(self.request)
+        self.assertEqual((first.get(self.product.id), second.get(self.product.id)), ((0, 0), (0, 0)))
+        first.set(self.product.id, 1, 10050)
+        second.set(self.product.id, 2, 10050)
+        self.assertEqual(self.lines(), [(self.session.session_key, self.product.id, 2, 10050)])
+
+    def test_concurrent_add_many(self):
+        first, second = DatabaseCartStorage(self.request), DatabaseCartStorage(self.request)
+        first.get(self.product.id), second.get(self.product.id)
+        first.set_many({self.product.id: (1, 10050)})
+        second.set_many({self.product.id: (3, 10050)})
+        self.assertEqual(self.lines(), [(self.session.session_key, self.product.id, 3, 10050)])
+
+    def test_clearsessions_deletes_lines_of_deleted_sessions(self):
+        DatabaseCartStorage(self.request).set(self.product.id, 1, 10050)
+        other = SessionStore()
+        other.create()
+        DatabaseCartStorage(SimpleNamespace(session=other)).set(self.product.id, 2, 10050)
+        other.delete()
+        call_command('clearsessions')
+        self.assertEqual(self.lines(), [(self.session.session_key, self.product.id, 1, 10050)])
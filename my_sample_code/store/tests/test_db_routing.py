@@ -0,0 +1,140 @@
+import time
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+
+from store.models import Product
+from store.utils.catalogue_cache import catalogue_cache
+from store.utils.report_cache import report_cache
+from store.utils.db_routing import replica_routing
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_LAG=5)
+class ReplicaRouterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_default_outside_replica_views(self):
+        self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_safe_requests_read_from_replica(self):
+        with replica_routing.use_replica(self.factory.get('/')):
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_unsafe_requests_read_from_default(self):
+        with replica_routing.use_replica(self.factory.post('/')):
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_client_that_wrote_reads_from_default(self):
+        response = HttpResponse()
+        replica_routing.pin(response)
+        self.assertEqual(response.cookies[replica_routing.cookie_name]['max-age'], 5)
+        request = self.factory.get('/')
+        request.COOKIES[replica_routing.cookie_name] = response.cookies[replica_routing.cookie_name].value
+        with replica_routing.use_replica(request):
+            self.assertEqual(router.db_for_read(Product), 'default')
+        for value in (str(time.time() - 1), 'not a time'):
+            request.COOKIES[replica_routing.cookie_name] = value
+            with replica_routing.use_replica(request):
+                self.assertEqual(router.db_for_read(Product), 'replica')
+
+    def test_data_cached_after_recent_change_is_read_from_default(self):
+        with replica_routing.use_replica(self.factory.get('/')):
+            with replica_routing.after_change(lambda: time.time() - 1):
+                self.assertEqual(router.db_for_read(Product), 'default')
+            with replica_routing.after_change(lambda: time.time() - 10):
+                self.assertEqual(router.db_for_read(Product), 'replica')
+            with replica_routing.after_change(lambda: None):
+                self.assertEqual(router.db_for_read(Product), 'replica')
+
+    def test_migrations_run_on_default_only(self):
+        self.assertFalse(router.allow_migrate('replica', 'store', model_name='product'))
+        self.assertTrue(router.allow_migrate('default', 'store', model_name='product'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_default(self):
+        with replica_routing.use_replica(self.factory.get('/')):
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTransactionTestCase(TestCase):
+
+    def test_reads_in_transaction_go_to_default(self):
+        # TestCase runs every test in a transaction
+        with replica_routing.use_replica(RequestFactory().get('/')):
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'No replica database is configured')
+class ReplicaReadsTestCase(APITransactionTestCase):
+    """
+    Needs a replica in DATABASES with TEST MIRROR of 'default', the data is committed so the replica connection sees it
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        self.product = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                              price=100, cost_price=10, quantity=10)
+        cache.clear()
+        catalogue_cache.local.clear()
+        report_cache.shared.clear()
+        self.today = timezone.localdate().strftime('%d.%m.%Y')
+
+    def queries(self, method, *args, **kwargs):
+        """
+        Queries run on default and on the replica while the request was served
+        """
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections[settings.DATABASE_REPLICAS[0]]) as replica:
+            response = getattr(self.client, method)(*args, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response, len(default), len(replica)
+
+    def test_product_reads_use_replica(self):
+        for url in (reverse('product-list'), reverse('product-detail', args=(self.product.id,))):
+            response, default_queries, replica_queries = self.queries('get', url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(default_queries, 0)
+            self.assertGreater(replica_queries, 0)
+
+    def test_report_reads_use_replica(self):
+        for query in ({}, {'format': 'csv'}):
+            response, default_queries, replica_queries = self.queries(
+                'get', reverse('proceeds'), {'date_from': self.today, 'date_to': self.today, **query})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(default_queries, 0)
+            self.assertGreater(replica_queries, 0)
+
+    def test_client_reads_from_default_after_write(self):
+        response = self.client.post(reverse('cart'), data={'product_id': self.product.id, 'quantity_to_buy': 1},
+                                    format='json')
+        self.assertIn(replica_routing.cookie_name, response.cookies)
+        response, default_queries, replica_queries = self.queries('get', reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(replica_queries, 0)
+
+    def test_cart_reads_from_default(self):
+        response, default_queries, replica_queries = self.queries('get', reverse('cart'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(replica_queries, 0)
+
+    def test_page_cached_after_change_is_built_from_default(self):
+        self.product.save()
+        response, default_queries, replica_queries = self.queries('get', reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(default_queries, 0)
+        self.assertEqual(replica_queries, 0)
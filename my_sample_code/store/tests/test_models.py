@@ -0,0 +1,276 @@
+import datetime
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from store.models import Product, Order, OrderProduct, DailyProductSales, Job
+from store.utils.cart import Cart
+from store.utils.checkout import Checkout, NothingToSellError
+from store.utils.jobs import JobQueue, job_queue
+
+ORDER_DATA = {'customer_name': 'test_name',
+              'email': 'test@email.com',
+              'address': 'test street',
+              'postal_code': '123456',
+              'city': 'test_city'}
+
+
+def make_cart(*products_with_quantity):
+    cart = Cart(SimpleNamespace(session=SessionBase()))
+    for product, quantity in products_with_quantity:
+        cart.add(product={'id': product.id, 'quantity': product.quantity, 'price': str(product.price)},
+                 quantity_to_buy=quantity)
+    return cart
+
+
+def make_order():
+    return Order.objects.create(**ORDER_DATA)
+
+
+class ProductReserveTestCase(TestCase):
+
+    def setUp(self):
+        self.product1 = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                               price=100, cost_price=10, quantity=10)
+        self.product2 = Product.objects.create(name='test_product_2', vendor_code='A2',
+                                               price=200, cost_price=20, quantity=2)
+
+    def test_reserve_all_lines(self):
+        reserved, shortages = Product.objects.reserve({self.product1.id: 4, self.product2.id: 2})
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(reserved, {self.product1.id: 4, self.product2.id: 2})
+        self.assertEqual(shortages, {})
+        self.assertEqual(self.product1.quantity, 6)
+        self.assertEqual(self.product2.quantity, 0)
+
+    def test_reserve_reports_shortages(self):
+        reserved, shortages = Product.objects.reserve({self.product1.id: 4, self.product2.id: 3, 0: 1})
+        self.product2.refresh_from_db()
+        self.assertEqual(reserved, {self.product1.id: 4})
+        self.assertEqual(shortages, {self.product2.id: 2, 0: 0})
+        self.assertEqual(self.product2.quantity, 2)
+
+    def test_reserve_uses_constant_number_of_queries(self):
+        with self.assertNumQueries(4):
+            Product.objects.reserve({self.product1.id: 1, self.product2.id: 1})
+
+
+class CheckoutTestCase(TestCase):
+
+    def setUp(self):
+        self.products = [Product.objects.create(name=f'test_product_{number}', vendor_code=f'A{number}',
+                                                price=100, cost_price=10, quantity=10)
+                         for number in range(20)]
+
+    def test_place_order(self):
+        cart = make_cart((self.products[0], 5), (self.products[1], 2))
+        self.products[1].quantity = 1
+        self.products[1].save()
+        order, selled_products, not_selled_products = Checkout(cart).place_order(ORDER_DATA)
+        self.assertEqual(selled_products, {self.products[0].id: {'quantity': 5, 'total_price': 500}})
+        self.assertEqual(not_selled_products, {self.products[1].id: 1})
+        self.assertEqual(list(order.items.values_list('product_id', 'quantity')), [(self.products[0].id, 5)])
+        self.assertEqual(Order.objects.get().customer_name, 'test_name')
+
+    def test_nothing_to_sell_rolls_back(self):
+        cart = make_cart((self.products[0], 5))
+        Product.objects.filter(id=self.products[0].id).update(quantity=1)
+        with self.assertRaises(NothingToSellError) as raised:
+            Checkout(cart).place_order(ORDER_DATA)
+        self.assertEqual(raised.exception.not_selled_products, {self.products[0].id: 1})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_place_order_keeps_unit_prices_on_lines(self):
+        Product.objects.filter(id=self.products[0].id).update(cost_price=15)
+        order, _, _ = Checkout(make_cart((self.products[0], 2))).place_order(ORDER_DATA)
+        self.assertEqual(list(order.items.values_list('unit_price', 'unit_cost')), [(100, 15)])
+
+    def test_negative_line_without_unit_prices_is_refused(self):
+        with self.assertRaises(IntegrityError):
+            OrderProduct.objects.create(order=make_order(), product=self.products[0], quantity=1)
+
+    def test_place_order_uses_constant_number_of_queries(self):
+        for cart_size in (1, 20):
+            with self.subTest(cart_size=cart_size):
+                cart = make_cart(*((product, 1) for product in self.products[:cart_size]))
+                with self.assertNumQueries(10):
+                    Checkout(cart).place_order(ORDER_DATA)
+
+
+class OrderCancelTestCase(TestCase):
+
+    def setUp(self):
+        self.product1 = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                               price=100, cost_price=10, quantity=10)
+        self.product2 = Product.objects.create(name='test_product_2', vendor_code='A2',
+                                               price=200, cost_price=20, quantity=10)
+        self.orders = [make_order() for _ in range(3)]
+        for order in self.orders:
+            OrderProduct.objects.create(order=order, product=self.product1, quantity=2, unit_price=100, unit_cost=10)
+            OrderProduct.objects.create(order=order, product=self.product2, quantity=1, unit_price=200, unit_cost=20)
+
+    def test_cancel_restocks_all_orders(self):
+        returned = Order.objects.filter(id__in=[order.id for order in self.orders]).cancel()
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(returned, [order.id for order in self.orders])
+        self.assertEqual(self.product1.quantity, 16)
+        self.assertEqual(self.product2.quantity, 13)
+        self.assertEqual(Order.objects.filter(returned=True).count(), 3)
+
+    def test_cancel_skips_returned_orders(self):
+        self.assertTrue(self.orders[0].cancel_order())
+        self.assertFalse(self.orders[0].cancel_order())
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.quantity, 12)
+
+    def test_cancel_uses_constant_number_of_queries(self):
+        with self.assertNumQueries(10):
+            Order.objects.filter(id=self.orders[0].id).cancel()
+        with self.assertNumQueries(10):
+            Order.objects.filter(id__in=[order.id for order in self.orders[1:]]).cancel()
+
+
+class JobQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                              price=100, cost_price=10, quantity=10)
+
+    def test_order_events_book_daily_sales(self):
+        order, _, _ = Checkout(make_cart((self.product, 4))).place_order(ORDER_DATA)
+        order.cancel_order()
+        self.assertFalse(DailyProductSales.objects.exists())
+        self.assertEqual(job_queue.run_pending(), 2)
+        sales = DailyProductSales.objects.get()
+        self.assertEqual((sales.sold, sales.refunded, sales.proceeds, sales.cost), (4, 4, 0, 0))
+        self.assertEqual(set(Job.objects.values_list('name', 'status')),
+                         {('order_created', Job.DONE), ('orders_returned', Job.DONE)})
+
+    def test_failed_job_is_retried_and_rolled_back(self):
+        queue = JobQueue(max_attempts=3, retry_delay=0)
+
+        @queue.handler('failing')
+        def failing():
+            Product.objects.update(quantity=0)
+            raise ValueError('failed')
+
+        Job.objects.enqueue('failing')
+        with self.assertLogs('store.utils.jobs', level='ERROR'):
+            self.assertEqual(queue.run_pending(), 3)
+        job = Job.objects.get()
+        self.product.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertIn('ValueError: failed', job.error)
+        self.assertEqual(self.product.quantity, 10)
+
+    def test_run_worker_command(self):
+        Checkout(make_cart((self.product, 1))).place_order(ORDER_DATA)
+        out = io.StringIO()
+        call_command('run_worker', processes=0, burst=True, stdout=out)
+        self.assertIn('Ran 1 jobs', out.getvalue())
+        self.assertEqual(DailyProductSales.objects.get().sold, 1)
+
+    @override_settings(JOB_RETENTION=60)
+    def test_purge_jobs_command(self):
+        done = Job.objects.enqueue('order_created')
+        Job.objects.enqueue('order_created')
+        Job.objects.enqueue('failing')
+        Job.objects.filter(id=done.id).update(status=Job.DONE,
+                                              finished=timezone.now() - datetime.timedelta(seconds=120))
+        Job.objects.exclude(id=done.id).filter(name='order_created').update(status=Job.DONE, finished=timezone.now())
+        Job.objects.filter(name='failing').update(status=Job.FAILED,
+                                                  finished=timezone.now() - datetime.timedelta(seconds=120))
+        out = io.StringIO()
+        call_command('purge_jobs', stdout=out)
+        self.assertIn('Deleted 1 finished jobs', out.getvalue())
+        self.assertFalse(Job.objects.filter(id=done.id).exists())
+        self.assertEqual(Job.objects.count(), 2)
+
+
+class SeedStoreTestCase(TestCase):
+
+    def test_seed_store_command(self):
+        out = io.StringIO()
+        call_command('seed_store', products=20, orders=50, days=10, lines_per_order=2, refund_ratio=0.5, stdout=out)
+        self.assertIn('20 products, 50 orders', out.getvalue())
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(OrderProduct.objects.count(), 100)
+        today = timezone.localdate()
+        days = set(timezone.localdate(created) for created in Order.objects.values_list('created', flat=True))
+        self.assertEqual(len(days), 10)
+        self.assertTrue(all(today - datetime.timedelta(days=10) <= day < today for day in days))
+        self.assertTrue(Order.objects.filter(returned=True).exists())
+        rollup = DailyProductSales.objects.aggregate(sold=Sum('sold'), refunded=Sum('refunded'))
+        self.assertEqual(rollup['sold'], OrderProduct.objects.aggregate(total=Sum('quantity'))['total'])
+        self.assertEqual(rollup['refunded'], OrderProduct.objects.filter(order__returned=True)
+                         .aggregate(total=Sum('quantity'))['total'])
+
+    def test_seed_store_is_reproducible(self):
+        call_command('seed_store', products=5, orders=5, days=2, stdout=io.StringIO())
+        first = list(Product.objects.order_by('id').values_list('price', 'cost_price'))
+        Product.objects.filter(name__startswith='seed_product_').update(name='seeded')
+        call_command('seed_store', products=5, orders=5, days=2, stdout=io.StringIO())
+        second = list(Product.objects.filter(name__startswith='seed_product_').order_by('id')
+                      .values_list('price', 'cost_price'))
+        self.assertEqual(first, second)
+
+    def test_negative_seed_store_invalid_options(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_store', days=0, stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('seed_store', refund_ratio=2, stdout=io.StringIO())
+
+
+class ConcurrentCheckoutTestCase(TransactionTestCase):
+    checkouts = 60
+    attempts = 50
+
+    def test_parallel_checkouts_do_not_oversell(self):
+        stock = 25
+        product = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                         price=100, cost_price=10, quantity=stock)
+        carts = [make_cart((product, 1)) for _ in range(self.checkouts)]
+        barrier = threading.Barrier(self.checkouts)
+        sold = []
+
+        def checkout(cart):
+            barrier.wait()
+            try:
+                for attempt in range(self.attempts):
+                    try:
+                        _, selled_products, _ = Checkout(cart).place_order(ORDER_DATA)
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting for it
+                        time.sleep(0.005 * attempt)
+                        continue
+                    except NothingToSellError:
+                        selled_products = {}
+                    sold.append(sum(item['quantity'] for item in selled_products.values()))
+                    return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        ordered = OrderProduct.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertEqual(len(sold), self.checkouts)
+        self.assertEqual(sum(sold), stock)
+        self.assertEqual(ordered, stock)
+        self.assertEqual(product.quantity, 0)
@@ -0,0 +1,144 @@
+import datetime
+import os
+import re
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.models import Product, Order, DailyProductSales
+from store.utils.pagination import KeysetPagination
+from store.utils.reports import Report
+from store.views import ProductAPIViewSet
+
+# STORE_QUERY_PLAN_ROWS=1000000 runs the checks against a production sized catalogue
+SEED_ROWS = int(os.environ.get('STORE_QUERY_PLAN_ROWS', 5000))
+BATCH_SIZE = 5000
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (store_\w+)'),
+    # Django aliases tables of subqueries as U0, U1...
+    'sqlite': re.compile(r'SCAN (?:TABLE )?(store_\w+|U\d+)(?: AS \w+)?$', re.MULTILINE),
+}
+# an index walked from its start instead of searched from a bound
+UNBOUNDED_INDEX_SCAN = {
+    'postgresql': re.compile(r'Index (?:Only )?Scan (?:Backward )?using \w+ on (store_\w+)(?![^\n]*\n\s+Index Cond)'),
+    'sqlite': re.compile(r'SCAN (?:TABLE )?(store_\w+|U\d+) USING (?:COVERING )?INDEX'),
+}
+# rows sorted after they were read, so a LIMIT does not stop the read early
+SORT = {
+    'postgresql': re.compile(r'\bSort\b'),
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+}
+PRODUCT_LIST_QUERIES = (
+    {},
+    {'ordering': 'name'}, {'ordering': '-name'}, {'ordering': 'price'}, {'ordering': '-price'},
+    {'ordering': 'cost_price'}, {'ordering': '-cost_price'},
+    {'name': 'product_10'}, {'vendor_code': 'V10'}, {'price': 10}, {'cost_price': 10},
+    {'price': 10, 'ordering': '-name'},
+    {'search': 'product_10'}, {'search': 'product_10', 'ordering': 'price'},
+)
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Hot lookups must be served by indexes. On small Postgres datasets sequential scans
+    are disabled, so the planner only falls back to them when no index can be used
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        day = timezone.localdate()
+        for start in range(0, SEED_ROWS, BATCH_SIZE):
+            stop = min(start + BATCH_SIZE, SEED_ROWS)
+            Product.objects.bulk_create([Product(name=f'product_{number}',
+                                                 vendor_code=f'V{number}',
+                                                 price=number % 1000,
+                                                 cost_price=number % 100,
+                                                 quantity=number % 50)
+                                         for number in range(start, stop)])
+            Order.objects.bulk_create([Order(customer_name=f'customer_{number}',
+                                             email='test@email.com',
+                                             address='test street',
+                                             postal_code='123456',
+                                             city='test_city',
+                                             returned=number % 10 == 0)
+                                       for number in range(start, stop)])
+        product_ids = list(Product.objects.values_list('id', flat=True)[:100])
+        DailyProductSales.objects.bulk_create([DailyProductSales(product_id=product_id,
+                                                                 day=day - datetime.timedelta(days=offset),
+                                                                 sold=1)
+                                               for product_id in product_ids
+                                               for offset in range(SEED_ROWS // 100)],
+                                              batch_size=BATCH_SIZE)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql' and SEED_ROWS < 1000000:
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertIndexed(self, queryset):
+        """
+        Tables are read by index searches. Without a WHERE a LIMIT query may walk a table or an index
+        in the order of its rows, the walk stops after the page
+        """
+        plan = queryset.explain()
+        if not queryset.query.where and queryset.query.high_mark is not None:
+            self.assertNotRegex(plan, SORT[connection.vendor])
+            return
+        self.assertEqual(SEQUENTIAL_SCAN[connection.vendor].findall(plan), [], plan)
+        self.assertEqual(UNBOUNDED_INDEX_SCAN[connection.vendor].findall(plan), [], plan)
+
+    def product_list_page(self, query, depth=None):
+        """
+        Query of the product list page the view runs, depth (0..1) places the cursor that far into the ordering
+        """
+        request = Request(APIRequestFactory().get('/api/v1/product/', query))
+        view = ProductAPIViewSet(request=request, format_kwarg=None, action='list')
+        queryset = view.filter_queryset(view.get_queryset())
+        paginator = KeysetPagination()
+        paginator.page_queryset(queryset, request)
+        cursor = None
+        if depth is not None:
+            ordering = paginator.ordering
+            item = queryset.order_by(*ordering)[int(queryset.count() * depth)]
+            cursor = {'ordering': ordering, 'position': paginator.get_position(item), 'reverse': False}
+        return paginator.page_queryset(queryset, request, cursor)
+
+    def test_product_list_deep_cursor_page_seeks_index(self):
+        for ordering in ('name', 'price', '-cost_price'):
+            with self.subTest(ordering=ordering):
+                plan = self.product_list_page({'ordering': ordering}, depth=0.9).explain()
+                self.assertEqual(UNBOUNDED_INDEX_SCAN[connection.vendor].findall(plan), [], plan)
+                self.assertEqual(SEQUENTIAL_SCAN[connection.vendor].findall(plan), [], plan)
+
+    def test_product_list_pages(self):
+        for query in PRODUCT_LIST_QUERIES:
+            for depth in (None, 0.5):
+                with self.subTest(query=query, depth=depth):
+                    self.assertIndexed(self.product_list_page(query, depth))
+
+    def test_reports(self):
+        today = timezone.localdate()
+        report = Report((today - datetime.timedelta(days=30)).strftime('%d.%m.%Y'), today.strftime('%d.%m.%Y'))
+        for name, queryset in (('sql', report.get_report_products()),
+                               ('lines', report.get_report_products('lines')),
+                               ('numpy sold lines', report.sold_lines()),
+                               ('numpy refunded lines', report.refunded_lines()),
+                               ('series', report.get_report_series('week')),
+                               ('series top', report.get_report_series('month', top=10))):
+            with self.subTest(report=name):
+                self.assertIndexed(queryset)
+
+    def test_report_from_order_lines_does_not_join_products(self):
+        day = timezone.localdate().strftime('%d.%m.%Y')
+        plan = Report(day, day).get_report_products_from_orders().explain()
+        self.assertNotRegex(plan, r'\bstore_product\b')
+
+    @skipUnless(connection.vendor == 'postgresql', 'Only Postgres has trigram indexes')
+    def test_product_name_search(self):
+        self.assertIndexed(Product.objects.filter(name__icontains='duct_10'))
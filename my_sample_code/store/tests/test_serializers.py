@@ -1,7 +1,14 @@
+import datetime
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
 
 from store.models import Product
 from store.serializers import ProductSerializer
+from store.utils.renderers import FastJSONRenderer
+from store.utils.row_encoder import product_rows
 
 
 class ProductSerializerTestCase(TestCase):
@@ -41,3 +48,51 @@ class ProductSerializerTestCase(TestCase):
             }
         ]
         self.assertEqual(serialized_data, expected_data)
+
+
+class ProductRowEncoderTestCase(TestCase):
+
+    def setUp(self):
+        Product.objects.create(name='test_product_1', vendor_code='A1', price='0.5', cost_price=0, quantity=0)
+        Product.objects.create(name='продукт \u2028 "2"', vendor_code='A2', about_product='\U0001f600\n',
+                               price='12345678.99', cost_price='0.01', quantity=2 ** 31 - 1)
+
+    def test_rows_are_encoded_as_serializer_does(self):
+        rows = Product.objects.order_by('id').values_list(*product_rows.fields)
+        self.assertEqual(product_rows.encode(rows),
+                         ProductSerializer(Product.objects.order_by('id'), many=True).data)
+
+    def test_decimals_are_quantized_as_serializer_does(self):
+        for value in ('1.005', '2.675', 3, 4.5, Decimal('-0.001'), Decimal('1E+2')):
+            with self.subTest(value=value):
+                encoded, = product_rows.encode([(1, 'name', 'A1', '', value, value, 1)])
+                expected = ProductSerializer().fields['price'].to_representation(value)
+                self.assertEqual(encoded['price'], expected)
+                self.assertEqual(encoded['cost_price'], expected)
+
+    def test_extra_columns_are_left_out(self):
+        encoded, = product_rows.encode([(1, 'name', 'A1', '', Decimal('1.00'), Decimal('2.00'), 1, 0.5)])
+        self.assertEqual(list(encoded), ['id', 'name', 'vendor_code', 'about_product', 'price', 'cost_price',
+                                         'quantity'])
+
+
+class FastJSONRendererTestCase(TestCase):
+    data = {'next': None,
+            'results': [{'id': 1, 'name': 'продукт\u2028\u2029"1"\t\x00\x7f\U0001f600', 'price': '1.00'}],
+            'created': datetime.datetime(2021, 7, 1, 12, 30, 15, 123, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2021, 7, 1),
+            'amount': Decimal('1.50'),
+            2: 'integer key'}
+
+    def test_same_bytes_as_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_data_orjson_can_not_encode_is_rendered_by_json(self):
+        data = {'big': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indented_and_without_orjson(self):
+        self.assertEqual(FastJSONRenderer().render(self.data, 'application/json; indent=4'),
+                         JSONRenderer().render(self.data, 'application/json; indent=4'))
+        with mock.patch('store.utils.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
@@ -1,11 +1,39 @@
+import csv
+import datetime
+import io
 import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APITestCase, APITransactionTestCase
 
-from store.models import Product
+from store.models import Product, Order, DailyProductSales, CartLine, IdempotencyKey
 from store.serializers import ProductSerializer
+from store.utils.catalogue_cache import catalogue_cache
+from store.utils.idempotency import idempotent_responses
+from store.utils.jobs import job_queue
+from store.utils.metrics import metrics
+from store.utils.report_cache import ReportCache, report_cache, check_report_cache
+from store.utils.search import product_search, create_search_triggers, SEARCH_TRIGGERS
+from store.utils.reports import Report, numpy
 
 
 class ProductAPITestCase(APITestCase):
@@ -37,28 +65,114 @@ class ProductAPITestCase(APITestCase):
         response = self.client.get(url)
         serialized_data = ProductSerializer([self.product1, self.product2, self.product3], many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serialized_data, response.data)
+        self.assertEqual(serialized_data, response.data['results'])
+
+    def test_get_product_list_same_bytes_as_serializer(self):
+        Product.objects.filter(id=self.product1.id).update(name='test_product_1 \u2028 "продукт"', price='0.5')
+        for query in ({}, {'ordering': '-price'}, {'search': 'test_product'}, {'page_size': 2}, {'cost_price': 30}):
+            with self.subTest(query=query):
+                response = self.client.get(reverse('product-list'), query)
+                products = [Product.objects.get(id=product['id']) for product in response.data['results']]
+                expected = JSONRenderer().render({'next': response.data['next'],
+                                                  'previous': response.data['previous'],
+                                                  'results': ProductSerializer(products, many=True).data})
+                self.assertEqual(response.content, expected)
 
     def test_get_product_list_filter(self):
         url = reverse('product-list')
         response = self.client.get(url, data={'cost_price': 30})
         serialized_data = ProductSerializer([self.product2, self.product3], many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serialized_data, response.data)
+        self.assertEqual(serialized_data, response.data['results'])
 
     def test_get_product_list_search(self):
         url = reverse('product-list')
         response = self.client.get(url, data={'search': 'test_product'})
-        serialized_data = ProductSerializer([self.product1, self.product2], many=True).data
+        # about_product is searched too, matches in name rank higher
+        serialized_data = ProductSerializer([self.product1, self.product2, self.product3], many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serialized_data, response.data)
+        self.assertEqual(serialized_data, response.data['results'])
+
+    def test_get_product_list_search_by_prefix_of_every_term(self):
+        url = reverse('product-list')
+        response = self.client.get(url, data={'search': 'TEST_PROD 2'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product2.id])
+        response = self.client.get(url, data={'search': 'than_search will'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product3.id])
+
+    def test_get_product_list_search_follows_updates(self):
+        Product.objects.filter(id=self.product1.id).update(name='renamed', about_product='')
+        self.product3.delete()
+        response = self.client.get(reverse('product-list'), data={'search': 'test_product'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product2.id])
+
+    def test_get_product_list_search_with_ordering_and_pages(self):
+        url = reverse('product-list')
+        response = self.client.get(url, data={'search': 'product', 'ordering': '-price'})
+        self.assertEqual([product['id'] for product in response.data['results']],
+                         [self.product3.id, self.product2.id, self.product1.id])
+        response = self.client.get(url, data={'search': 'test_product', 'page_size': 2})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product1.id, self.product2.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product3.id])
+
+    def test_get_product_list_search_returns_unranked_matches_after_ranked(self):
+        Product.objects.filter(id=self.product1.id).update(name='about_test_product_1')
+        with mock.patch.object(product_search, 'max_ranked', 2):
+            response = self.client.get(reverse('product-list'), data={'search': 'test_product'})
+            self.assertEqual([product['id'] for product in response.data['results']],
+                             [self.product2.id, self.product1.id, self.product3.id])
+            found = []
+            response = self.client.get(reverse('product-list'), data={'search': 'test_product', 'page_size': 1})
+            while True:
+                found += [product['id'] for product in response.data['results']]
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+        self.assertEqual(found, [self.product2.id, self.product1.id, self.product3.id])
+
+    def search_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'store_product'")
+            return {name for name, in cursor.fetchall()}
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 triggers are SQLite only')
+    def test_get_product_list_search_triggers_exist_after_migrations(self):
+        self.assertEqual(self.search_triggers(), set(SEARCH_TRIGGERS))
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 triggers are SQLite only')
+    def test_get_product_list_search_triggers_are_recreated_after_migrate(self):
+        with connection.cursor() as cursor:
+            for name in SEARCH_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {name}')
+        # a change made without triggers is picked up by the rebuild
+        Product.objects.filter(id=self.product2.id).update(name='renamed_2')
+        create_search_triggers(using=connection.alias)
+        self.assertEqual(self.search_triggers(), set(SEARCH_TRIGGERS))
+        Product.objects.filter(id=self.product1.id).update(name='renamed', about_product='')
+        response = self.client.get(reverse('product-list'), data={'search': 'test_product'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product2.id, self.product3.id])
+        response = self.client.get(reverse('product-list'), data={'search': 'renamed_2'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product2.id])
+
+    def test_get_negative_product_list_search_syntax_is_not_passed_through(self):
+        response = self.client.get(reverse('product-list'), data={'search': '"test* :* & (!) -'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([product['id'] for product in response.data['results']],
+                         [self.product1.id, self.product2.id, self.product3.id])
+        response = self.client.get(reverse('product-list'), data={'search': '!!!'})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_get_product_list_by_vendor_code(self):
+        response = self.client.get(reverse('product-list'), data={'vendor_code': 'A2'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product2.id])
 
     def test_get_product_list_inverse_order(self):
         url = reverse('product-list')
         response = self.client.get(url, data={'ordering': '-name'})
         serialized_data = ProductSerializer([self.product3, self.product2, self.product1], many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serialized_data, response.data)
+        self.assertEqual(serialized_data, response.data['results'])
 
     def test_post_create(self):
         self.assertEqual(3, Product.objects.all().count())
@@ -115,7 +229,41 @@ class ProductAPITestCase(APITestCase):
         response = self.client.get(url)
         serialized_data = ProductSerializer([self.product2, self.product3], many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serialized_data, response.data)
+        self.assertEqual(serialized_data, response.data['results'])
+
+    def test_get_product_list_pages(self):
+        url = reverse('product-list')
+        response = self.client.get(url, data={'page_size': 2, 'ordering': 'cost_price'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(ProductSerializer([self.product1, self.product2], many=True).data, response.data['results'])
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(ProductSerializer([self.product3], many=True).data, response.data['results'])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(ProductSerializer([self.product1, self.product2], many=True).data, response.data['results'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_get_product_list_pages_inverse_order_with_ties(self):
+        url = reverse('product-list')
+        response = self.client.get(url, data={'page_size': 1, 'ordering': '-cost_price'})
+        pages = [response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data['results'])
+        serialized_data = ProductSerializer([self.product3, self.product2, self.product1], many=True).data
+        self.assertEqual([[item] for item in serialized_data], pages)
+
+    def test_get_product_list_negative_invalid_cursor(self):
+        url = reverse('product-list')
+        response = self.client.get(url, data={'cursor': 'not-a-cursor'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+        response = self.client.get(url, data={'page_size': 1, 'ordering': 'name'})
+        response = self.client.get(response.data['next'].replace('ordering=name', 'ordering=price'))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
 
     def test_get_one_product(self):
         url = reverse('product-detail', args=(self.product3.id,))
@@ -125,6 +273,327 @@ class ProductAPITestCase(APITestCase):
         self.assertEqual(serialized_data, response.data)
 
 
+class ProductImportTestCase(APITestCase):
+
+    def setUp(self):
+        self.product1 = Product.objects.create(name='test_product_1',
+                                               about_product='about_test_product_1',
+                                               vendor_code='A1',
+                                               price=100,
+                                               cost_price=10,
+                                               quantity=1,
+                                               )
+
+    def upload(self, name, content, **data):
+        return self.client.post(reverse('product-import'),
+                                data={'file': SimpleUploadedFile(name, content.encode()), **data},
+                                format='multipart')
+
+    def test_import_csv(self):
+        content = ('name,vendor_code,price,cost_price,quantity\n'
+                   'test_product_1_new,A1,150,15,5\n'
+                   'test_product_2,A2,200,20,2\n'
+                   'test_product_3,A3,not_a_price,30,3\n')
+        response = self.upload('products.csv', content)
+        self.product1.refresh_from_db()
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((3, 1, 1), (response.data['rows'], response.data['created'], response.data['updated']))
+        self.assertEqual(4, response.data['errors'][0]['row'])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertEqual(('test_product_1_new', 150, 'about_test_product_1'),
+                         (self.product1.name, self.product1.price, self.product1.about_product))
+        self.assertEqual(2, Product.objects.get(vendor_code='A2').quantity)
+        self.assertFalse(Product.objects.filter(vendor_code='A3').exists())
+
+    def test_imported_products_are_searchable(self):
+        self.upload('products.csv', 'name,vendor_code,price,cost_price,quantity\n'
+                                    'renamed_product,A1,150,15,5\n'
+                                    'new_product,A2,200,20,2\n')
+        response = self.client.get(reverse('product-list'), data={'search': 'product'})
+        self.assertEqual({product['vendor_code'] for product in response.data['results']}, {'A1', 'A2'})
+        response = self.client.get(reverse('product-list'), data={'search': 'renamed'})
+        self.assertEqual([product['vendor_code'] for product in response.data['results']], ['A1'])
+
+    def test_import_ndjson(self):
+        content = ('{"name": "test_product_2", "vendor_code": "A2", "price": "200.00", "cost_price": 20}\n'
+                   'not json\n'
+                   '{"name": "test_product_1", "vendor_code": "A1", "price": 100, "cost_price": 10, "quantity": 7}\n')
+        response = self.upload('products.txt', content, data_format='ndjson')
+        self.product1.refresh_from_db()
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((3, 1, 1), (response.data['rows'], response.data['created'], response.data['updated']))
+        self.assertEqual(2, response.data['errors'][0]['row'])
+        self.assertEqual(7, self.product1.quantity)
+
+    def test_import_negative_undecodable_ndjson_line(self):
+        content = (b'{"name": "test_product_2", "vendor_code": "A2", "price": 200, "cost_price": 20}\n'
+                   b'{"name": "caf\xff", "vendor_code": "A3", "price": 300, "cost_price": 30}\n'
+                   b'{"name": "test_product_4", "vendor_code": "A4", "price": 400, "cost_price": 40}\n')
+        response = self.client.post(reverse('product-import'),
+                                    data={'file': SimpleUploadedFile('products.ndjson', content)}, format='multipart')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((3, 2), (response.data['rows'], response.data['created']))
+        self.assertEqual(2, response.data['errors'][0]['row'])
+        self.assertFalse(Product.objects.filter(vendor_code='A3').exists())
+
+    def test_import_negative_unreadable_csv_stops_with_row_error(self):
+        content = ('name,vendor_code,price,cost_price,quantity\n'
+                   'test_product_2,A2,200,20,2\n'
+                   'caf\xe9,A3,300,30,3\n'
+                   'test_product_4,A4,400,40,4\n').encode('latin-1')
+        response = self.client.post(reverse('product-import'),
+                                    data={'file': SimpleUploadedFile('products.csv', content)}, format='multipart')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((2, 1), (response.data['rows'], response.data['created']))
+        self.assertEqual(3, response.data['errors'][0]['row'])
+        self.assertIn('File can not be read from this row on',
+                      response.data['errors'][0]['errors']['non_field_errors'][0])
+        self.assertEqual(['A1', 'A2'], list(Product.objects.order_by('vendor_code').values_list('vendor_code',
+                                                                                                flat=True)))
+        response = self.upload('products.csv', 'name,vendor_code,price,cost_price,quantity\n'
+                                               f'{"x" * (csv.field_size_limit() + 1)},A5,500,50,5\n')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn('field larger than field limit', response.data['errors'][0]['errors']['non_field_errors'][0])
+
+    def test_import_negative_unknown_format(self):
+        response = self.upload('products.xml', '<products/>')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as products_file:
+            products_file.write('name,vendor_code,price,cost_price,quantity\ntest_product_2,A2,200,20,2\n')
+            products_file.flush()
+            stdout = io.StringIO()
+            call_command('import_products', products_file.name, stdout=stdout, stderr=io.StringIO())
+        self.assertIn('1 rows, 1 created, 0 updated, 0 errors', stdout.getvalue())
+        self.assertTrue(Product.objects.filter(vendor_code='A2').exists())
+
+    def test_import_command_negative_unreadable_file(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv') as products_file:
+            products_file.write('name,vendor_code,price,cost_price,quantity\ncaf\xe9,A2,200,20,2\n'.encode('latin-1'))
+            products_file.flush()
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('import_products', products_file.name, stdout=stdout, stderr=stderr)
+        self.assertIn('1 rows, 0 created, 0 updated, 1 errors', stdout.getvalue())
+        self.assertIn('row 2:', stderr.getvalue())
+
+
+class ProductCacheTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalogue_cache.local.clear()
+        self.product1 = Product.objects.create(name='test_product_1',
+                                               about_product='about_test_product_1',
+                                               vendor_code='A1',
+                                               price=100,
+                                               cost_price=10,
+                                               quantity=100,
+                                               )
+
+    def test_get_product_list_from_cache(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url)
+        self.assertEqual(response.content, cached_response.content)
+        self.assertEqual(response['ETag'], cached_response['ETag'])
+
+    def test_get_one_product_not_modified(self):
+        url = reverse('product-detail', args=(self.product1.id,))
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(b'', response.content)
+
+    def test_cache_invalidated_by_product_update(self):
+        list_response = self.client.get(reverse('product-list'))
+        detail_response = self.client.get(reverse('product-detail', args=(self.product1.id,)))
+        self.client.put(reverse('update_product_economic_data'),
+                        data={'id': self.product1.id, 'price': 500, 'cost_price': 10, 'quantity': 100},
+                        format='json')
+
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=list_response['ETag'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('500.00', response.data['results'][0]['price'])
+        response = self.client.get(reverse('product-detail', args=(self.product1.id,)),
+                                   HTTP_IF_NONE_MATCH=detail_response['ETag'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('500.00', response.data['price'])
+
+    def test_cache_invalidated_by_order(self):
+        self.client.get(reverse('product-detail', args=(self.product1.id,)))
+        self.client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 10}, format='json')
+        self.client.post(reverse('order'), data={"customer_name": "test_name",
+                                                 "email": "test@email.com",
+                                                 "address": "test street",
+                                                 "postal_code": 123456,
+                                                 "city": "test_city"}, format='json')
+        response = self.client.get(reverse('product-detail', args=(self.product1.id,)))
+        self.assertEqual(90, response.data['quantity'])
+
+    def test_cache_hit_ratio(self):
+        url = reverse('product-list')
+        for _ in range(4):
+            self.client.get(url)
+        stats = catalogue_cache.stats()
+        self.assertGreater(stats['hit_ratio'], 0)
+        self.assertGreaterEqual(stats['local_hits'], 3)
+
+
+class QueryCountHeaderTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalogue_cache.local.clear()
+        self.product = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                              price=100, cost_price=10, quantity=10)
+
+    @override_settings(QUERY_COUNT_HEADER=True)
+    def test_query_count_header(self):
+        url = reverse('product-detail', args=(self.product.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response['X-Query-Count'], str(len(queries)))
+        self.assertGreaterEqual(float(response['X-Query-Time']), 0)
+        self.assertEqual(self.client.get(url)['X-Query-Count'], '0')
+
+    @override_settings(QUERY_COUNT_HEADER=False)
+    def test_no_query_count_header_when_off(self):
+        response = self.client.get(reverse('product-detail', args=(self.product.id,)))
+        self.assertFalse(response.has_header('X-Query-Count'))
+
+
+class MetricsTestCase(APITestCase):
+    """
+    Metrics are kept for the whole process, tests compare values before and after requests
+    """
+
+    def setUp(self):
+        cache.clear()
+        catalogue_cache.local.clear()
+        self.product = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                              price=100, cost_price=10, quantity=10)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def assertIncreased(self, before, after, name, value):
+        self.assertEqual(after.get(name, 0) - before.get(name, 0), value, name)
+
+    def test_route_latency_and_queries(self):
+        before = self.scrape()
+        url = reverse('product-detail', args=(self.product.id,))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        # captured queries are read from the connection log, which the next request resets
+        query_count = len(queries)
+        self.client.get(reverse('product-list'))
+        after = self.scrape()
+        labels = '{route="product-detail",method="GET"}'
+        self.assertIncreased(before, after, f'http_request_duration_seconds_count{labels}', 1)
+        self.assertIncreased(before, after, f'db_queries_per_request_sum{labels}', query_count)
+        self.assertIncreased(before, after, 'http_request_duration_seconds_bucket'
+                                            '{route="product-detail",method="GET",le="+Inf"}', 1)
+        self.assertIncreased(before, after, 'http_responses_total{route="product-list",method="GET",status="2xx"}', 1)
+        self.assertIn('catalogue_cache_hit_ratio', after)
+        self.assertIn('report_cache_hit_ratio', after)
+
+    def test_unknown_routes_share_one_label(self):
+        before = self.scrape()
+        self.client.get('/no/such/page/')
+        self.client.get('/another/missing/page/')
+        after = self.scrape()
+        self.assertIncreased(before, after, 'http_responses_total{route="unmatched",method="GET",status="4xx"}', 2)
+
+    def test_store_counters(self):
+        before = self.scrape()
+        self.client.post(reverse('cart'), data={'product_id': self.product.id, 'quantity_to_buy': 2}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order'), data={'customer_name': 'test_name',
+                                                                'email': 'test@email.com',
+                                                                'address': 'test street',
+                                                                'postal_code': 123456,
+                                                                'city': 'test_city'}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('order'), data={'order_id': response.data['order_data']['id']}, format='json')
+        after = self.scrape()
+        self.assertIncreased(before, after, 'store_orders_created_total', 1)
+        self.assertIncreased(before, after, 'store_order_lines_sold_total', 1)
+        self.assertIncreased(before, after, 'store_order_lines_unsold_total', 0)
+        self.assertIncreased(before, after, 'store_orders_refunded_total', 1)
+        self.assertGreater(after['session_write_bytes_total'], before['session_write_bytes_total'])
+        self.assertGreater(after['session_read_bytes_total'], before['session_read_bytes_total'])
+
+    def test_unsold_lines_counter(self):
+        self.client.post(reverse('cart'), data={'product_id': self.product.id, 'quantity_to_buy': 5}, format='json')
+        Product.objects.filter(id=self.product.id).update(quantity=1)
+        before = self.scrape()
+        self.client.post(reverse('order'), data={'customer_name': 'test_name',
+                                                 'email': 'test@email.com',
+                                                 'address': 'test street',
+                                                 'postal_code': 123456,
+                                                 'city': 'test_city'}, format='json')
+        self.assertIncreased(before, self.scrape(), 'store_order_lines_unsold_total', 1)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_not_recorded_when_off(self):
+        route = metrics.route('product-list', 'GET')
+        requests = sum(route.latency.counts)
+        self.client.get(reverse('product-list'))
+        self.assertEqual(sum(route.latency.counts), requests)
+
+    def test_metrics_forbidden_to_other_addresses(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(QUERY_COUNT_HEADER=True, METRICS_ENABLED=True)
+class MetricsQueryCountThreadTestCase(APITransactionTestCase):
+
+    def test_connection_opened_inside_request_keeps_wrappers_balanced(self):
+        Product.objects.create(name='test_product_1', vendor_code='A1', price=100, cost_price=10, quantity=10)
+        route = metrics.route('product-list', 'GET')
+        results = []
+
+        def send():
+            try:
+                for _ in range(6):
+                    # connections are closed between requests, the next one opens inside the request
+                    connection.close()
+                    cache.clear()
+                    catalogue_cache.local.clear()
+                    queries = route.queries.sum
+                    response = self.client_class().get(reverse('product-list'))
+                    results.append((len(connection.execute_wrappers),
+                                    int(response['X-Query-Count']),
+                                    route.queries.sum - queries))
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(results), 6)
+        for wrappers, header_count, metrics_count in results:
+            self.assertEqual(wrappers, 0)
+            self.assertGreater(header_count, 0)
+            self.assertEqual(metrics_count, header_count)
+
+
 class UpdateProductEconomicDataAPIViewTestCase(APITestCase):
 
     def setUp(self):
@@ -185,6 +654,49 @@ class UpdateProductEconomicDataAPIViewTestCase(APITestCase):
         self.assertEqual(content['detail'], error_text)
         self.assertEqual(status_code, 404)
 
+    def test_change_only_price(self):
+        status_code, content = self.request({'id': self.product1.id, 'price': 300})
+        self.product1.refresh_from_db()
+        self.assertEqual(status_code, 200)
+        self.assertEqual((300, 10, 1), (self.product1.price, self.product1.cost_price, self.product1.quantity))
+
+    def test_change_batch(self):
+        product2 = Product.objects.create(name='test_product_2', vendor_code='A2', price=200, cost_price=20, quantity=2)
+        status_code, content = self.request([{'id': self.product1.id, 'price': 150},
+                                             {'id': product2.id, 'quantity': 20, 'cost_price': 25},
+                                             {'id': self.product1.id, 'quantity': 5}])
+        self.product1.refresh_from_db()
+        product2.refresh_from_db()
+        self.assertEqual(status_code, 200)
+        self.assertEqual(content['updated_products'], 2)
+        self.assertEqual((150, 10, 5), (self.product1.price, self.product1.cost_price, self.product1.quantity))
+        self.assertEqual((200, 25, 20), (product2.price, product2.cost_price, product2.quantity))
+
+    def test_change_batch_queries_do_not_grow_with_products(self):
+        products = [Product.objects.create(name=f'test_product_{number}', vendor_code=f'B{number}',
+                                           price=10, cost_price=1, quantity=1)
+                    for number in range(20)]
+        queries = []
+        for batch in (products[:2], products):
+            with CaptureQueriesContext(connection) as context:
+                status_code, _ = self.request([{'id': product.id, 'price': 20} for product in batch])
+            self.assertEqual(status_code, 200)
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+    def test_negative_change_batch_not_found_product(self):
+        status_code, content = self.request([{'id': self.product1.id, 'price': 150}, {'id': 0, 'price': 1}])
+        self.product1.refresh_from_db()
+        self.assertEqual(status_code, 404)
+        self.assertEqual(content['not_found_products'], [0])
+        self.assertEqual(self.product1.price, 100)
+
+    def test_negative_change_batch_invalid_data(self):
+        status_code, content = self.request([{'id': self.product1.id, 'quantity': -1}, {'price': 1}])
+        self.assertEqual(status_code, 400)
+        self.assertIn('quantity', content[0])
+        self.assertIn('id', content[1])
+
 
 class CartAPIViewTestCase(APITestCase):
 
@@ -298,6 +810,61 @@ class CartAPIViewTestCase(APITestCase):
         self.assertEqual(content["detail"], 'Not found.')
         self.assertEqual(status_code, 404)
 
+    def test_post_bulk_add_products_to_cart(self):
+        self.client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 90}, format='json')
+        data = {"lines": [{"product_id": self.product1.id, "quantity_to_buy": 5},
+                          {"product_id": self.product2.id, "quantity_to_buy": 150},
+                          {"product_id": self.product1.id, "quantity_to_buy": 10},
+                          {"product_id": self.product2.id, "quantity_to_buy": 60},
+                          {"product_id": 0, "quantity_to_buy": 1}]}
+        response = self.client.post(reverse('cart_bulk'), data=data, format='json')
+        status_code, content = response.status_code, json.loads(response.content)
+        self.assertEqual(status_code, 200)
+        self.assertEqual([line['accepted'] for line in content['lines']], [True, True, False, False, False])
+        self.assertEqual(content['lines'][2]['detail'], 'The quantity of the product is too large')
+        self.assertEqual(content['lines'][4]['detail'], 'Not found.')
+        self.assertEqual(content['products'], {str(self.product1.id): {"quantity": 95, "price": "100.00"},
+                                               str(self.product2.id): {"quantity": 150, "price": "200.00"}})
+
+        response = self.client.get(reverse('cart'), format='json')
+        self.assertEqual(json.loads(response.content), content['products'])
+
+    def test_post_bulk_add_products_to_cart_queries_do_not_grow_with_lines(self):
+        products = [self.product1, self.product2] + [
+            Product.objects.create(name=f'test_product_{number}', vendor_code=f'B{number}',
+                                   price=10, cost_price=1, quantity=10)
+            for number in range(10)]
+        queries = []
+        for cart_products in (products[:1], products):
+            self.client = self.client_class()
+            data = {"lines": [{"product_id": product.id, "quantity_to_buy": 1} for product in cart_products]}
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('cart_bulk'), data=data, format='json')
+            self.assertEqual(response.status_code, 200)
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+    def test_post_negative_bulk_add_products_to_cart(self):
+        data = {"lines": [{"product_id": self.product1.id, "quantity_to_buy": 1000}]}
+        response = self.client.post(reverse('cart_bulk'), data=data, format='json')
+        status_code, content = response.status_code, json.loads(response.content)
+        self.assertEqual(status_code, 400)
+        self.assertEqual(content['detail'], 'No product was added to your cart')
+
+        response = self.client.post(reverse('cart_bulk'), data={"lines": []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CART_STORAGE_BACKEND='store.utils.cart.DatabaseCartStorage')
+class DatabaseCartAPIViewTestCase(CartAPIViewTestCase):
+
+    def test_post_add_product_to_cart_writes_one_line(self):
+        self.client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 10}, format='json')
+        self.client.post(reverse('cart'), data={"product_id": self.product2.id, "quantity_to_buy": 5}, format='json')
+        self.client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 5}, format='json')
+        lines = CartLine.objects.order_by('product_id').values_list('product_id', 'quantity', 'price_cents')
+        self.assertEqual(list(lines), [(self.product1.id, 15, 10000), (self.product2.id, 5, 20000)])
+
 
 class OrderAPIViewTestCase(APITestCase):
 
@@ -364,3 +931,490 @@ class OrderAPIViewTestCase(APITestCase):
         self.assertEqual(content["selled_products"], expected_selled_products)
         self.assertEqual(content["not_selled_products"], expected_not_selled_products)
         self.assertEqual(status_code, 201)
+
+    def test_post_negative_nothing_can_be_sold(self):
+        Product.objects.filter(id__in=[self.product1.id, self.product2.id]).update(quantity=1)
+        data = {"customer_name": "test_name",
+                "email": "test@email.com",
+                "address": "test street",
+                "postal_code": 123456,
+                "city": "test_city"}
+        response = self.client.post(reverse('order'), data=data, format='json')
+        status_code, content = response.status_code, json.loads(response.content)
+        self.assertEqual(status_code, 400)
+        self.assertEqual(content['not_selled_products'], {str(self.product1.id): 1, str(self.product2.id): 1})
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.client.get(reverse('cart')).json()[str(self.product1.id)]['quantity'], 10)
+
+    def create_order(self):
+        data = {"customer_name": "test_name",
+                "email": "test@email.com",
+                "address": "test street",
+                "postal_code": 123456,
+                "city": "test_city"}
+        response = self.client.post(reverse('order'), data=data, format='json')
+        return json.loads(response.content)['order_data']['id']
+
+    def test_patch_refund_order(self):
+        order_id = self.create_order()
+        response = self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.product1.quantity, 100)
+        self.assertEqual(self.product2.quantity, 200)
+
+    def test_patch_refund_order_twice_does_not_restock_twice(self):
+        order_id = self.create_order()
+        self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+        response = self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+        self.product1.refresh_from_db()
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.product1.quantity, 100)
+
+    def test_patch_negative_refund_not_found_order(self):
+        response = self.client.patch(reverse('order'), data={'order_id': 0}, format='json')
+        status_code, content = response.status_code, json.loads(response.content)
+        self.assertEqual(content['detail'], 'Order not found')
+        self.assertEqual(status_code, 404)
+
+    def test_patch_bulk_refund_orders(self):
+        first_order_id = self.create_order()
+        self.client.post(reverse('cart'), data=self.data_product1, format='json')
+        second_order_id = self.create_order()
+        self.client.patch(reverse('order'), data={'order_id': second_order_id}, format='json')
+        third_order_id = self.create_order()
+
+        response = self.client.patch(reverse('order'),
+                                     data={'order_ids': [first_order_id, second_order_id, third_order_id, 0]},
+                                     format='json')
+        status_code, content = response.status_code, json.loads(response.content)
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(status_code, 200)
+        self.assertEqual(content['returned_orders'], [first_order_id, third_order_id])
+        self.assertEqual(content['already_returned_orders'], [second_order_id])
+        self.assertEqual(content['not_found_orders'], [0])
+        self.assertEqual(self.product1.quantity, 100)
+        self.assertEqual(self.product2.quantity, 200)
+
+    def test_patch_negative_bulk_refund_invalid_order_ids(self):
+        response = self.client.patch(reverse('order'), data={'order_ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderIdempotencyTestCase(APITestCase):
+    order_data = {"customer_name": "test_name",
+                  "email": "test@email.com",
+                  "address": "test street",
+                  "postal_code": 123456,
+                  "city": "test_city"}
+
+    def setUp(self):
+        self.product1 = Product.objects.create(name='test_product_1', vendor_code='A1',
+                                               price=100, cost_price=10, quantity=100)
+        self.client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 10}, format='json')
+
+    def test_post_replayed_order_is_created_once(self):
+        first = self.client.post(reverse('order'), data=self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 10}, format='json')
+        replayed = self.client.post(reverse('order'), data=self.order_data, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='key-1')
+        self.product1.refresh_from_db()
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(json.loads(replayed.content), json.loads(first.content))
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.product1.quantity, 90)
+
+    def test_patch_replayed_refund_restocks_once(self):
+        order_id = json.loads(self.client.post(reverse('order'), data=self.order_data, format='json').content)[
+            'order_data']['id']
+        for _ in range(2):
+            response = self.client.patch(reverse('order'), data={'order_ids': [order_id]}, format='json',
+                                         HTTP_IDEMPOTENCY_KEY='refund-1')
+            self.assertEqual(json.loads(response.content)['returned_orders'], [order_id])
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.quantity, 100)
+
+    def test_negative_key_reused_for_another_request(self):
+        self.client.post(reverse('order'), data=self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        response = self.client.post(reverse('order'), data={**self.order_data, "city": "other_city"},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_negative_invalid_request_is_not_stored(self):
+        response = self.client.post(reverse('order'), data={}, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_negative_failed_response_is_not_stored(self):
+        Product.objects.filter(id=self.product1.id).update(quantity=0)
+        response = self.client.post(reverse('order'), data=self.order_data, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        Product.objects.filter(id=self.product1.id).update(quantity=100)
+        response = self.client.post(reverse('order'), data=self.order_data, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, 201)
+
+    def test_negative_key_of_another_client_is_not_replayed(self):
+        first = self.client.post(reverse('order'), data=self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        other_client = self.client_class()
+        other_client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 5}, format='json')
+        other = other_client.post(reverse('order'), data=self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(other.status_code, 201)
+        self.assertFalse(other.has_header('Idempotent-Replayed'))
+        self.assertNotEqual(json.loads(other.content)['order_data']['id'],
+                            json.loads(first.content)['order_data']['id'])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.filter(key='key-1').count(), 2)
+
+    def test_patch_replayed_refund_of_client_without_session_restocks_once(self):
+        order_id = json.loads(self.client.post(reverse('order'), data=self.order_data, format='json').content)[
+            'order_data']['id']
+        for _ in range(2):
+            response = self.client_class().patch(reverse('order'), data={'order_ids': [order_id]}, format='json',
+                                                 HTTP_IDEMPOTENCY_KEY='refund-1')
+            self.assertEqual(json.loads(response.content)['returned_orders'], [order_id])
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(IdempotencyKey.objects.get().client, 'anonymous')
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.quantity, 100)
+
+    def test_expired_key_is_handled_again_and_purged(self):
+        self.client.post(reverse('order'), data=self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        IdempotencyKey.objects.update(expires=timezone.now())
+        self.client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 10}, format='json')
+        self.client.post(reverse('order'), data=self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(Order.objects.count(), 2)
+        IdempotencyKey.objects.update(expires=timezone.now())
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class ConcurrentIdempotencyTestCase(APITransactionTestCase):
+
+    def test_concurrent_duplicate_waits_for_first_response(self):
+        request = SimpleNamespace(META={'HTTP_IDEMPOTENCY_KEY': 'key-1'}, method='POST',
+                                  path='/api/v1/order/', data={'order': 1},
+                                  session=SimpleNamespace(session_key='session-1'))
+        handled = []
+        started, release = threading.Event(), threading.Event()
+        responses = {}
+
+        def handle():
+            handled.append(True)
+            started.set()
+            release.wait(5)
+            return Response({'created': len(handled)}, status=201)
+
+        def send(name):
+            try:
+                responses[name] = idempotent_responses.respond(request, handle)
+            finally:
+                connection.close()
+
+        first = threading.Thread(target=send, args=('first',))
+        first.start()
+        started.wait(5)
+        duplicate = threading.Thread(target=send, args=('duplicate',))
+        duplicate.start()
+        time.sleep(0.2)
+        release.set()
+        first.join()
+        duplicate.join()
+        self.assertEqual(len(handled), 1)
+        self.assertEqual(responses['duplicate'].status_code, 201)
+        self.assertEqual(responses['duplicate'].data, {'created': 1})
+
+
+class ReportAPIViewTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        report_cache.shared.clear()
+        report_cache.hits = report_cache.misses = 0
+        self.product1 = Product.objects.create(name='test_product_1',
+                                               about_product='about_test_product_1',
+                                               vendor_code='A1',
+                                               price=100,
+                                               cost_price=10,
+                                               quantity=100,
+                                               )
+
+        self.product2 = Product.objects.create(name='test_product_2',
+                                               about_product='about_test_product_2',
+                                               vendor_code='A2',
+                                               price=200,
+                                               cost_price=30,
+                                               quantity=200)
+        self.today = timezone.localdate().strftime('%d.%m.%Y')
+
+    def create_order(self, *products_with_quantity):
+        for product, quantity in products_with_quantity:
+            self.client.post(reverse('cart'), data={"product_id": product.id, "quantity_to_buy": quantity},
+                             format='json')
+        data = {"customer_name": "test_name",
+                "email": "test@email.com",
+                "address": "test street",
+                "postal_code": 123456,
+                "city": "test_city"}
+        response = self.client.post(reverse('order'), data=data, format='json')
+        job_queue.run_pending()
+        return json.loads(response.content)['order_data']['id']
+
+    def request(self, data):
+        # the rollup is booked by the worker
+        job_queue.run_pending()
+        response = self.client.generic('GET', reverse('proceeds'), json.dumps(data), content_type='application/json')
+        return response.status_code, json.loads(response.content)
+
+    def test_get_report(self):
+        self.create_order((self.product1, 10), (self.product2, 5))
+        order_id = self.create_order((self.product1, 3))
+        self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+
+        status_code, content = self.request({'date_from': self.today, 'date_to': self.today})
+        expected_products = [{'product__id': self.product1.id,
+                              'refund_products': 3,
+                              'quantity_selled_products': 10,
+                              'proceeds': 1000.0,
+                              'profit': 900.0},
+                             {'product__id': self.product2.id,
+                              'refund_products': 0,
+                              'quantity_selled_products': 5,
+                              'proceeds': 1000.0,
+                              'profit': 850.0}]
+        self.assertEqual(status_code, 200)
+        self.assertEqual(content['products'], expected_products)
+
+    def test_get_report_is_empty_outside_of_date_range(self):
+        self.create_order((self.product1, 10))
+        status_code, content = self.request({'date_from': '01.01.2000', 'date_to': '31.12.2000'})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(content['products'], [])
+
+    def test_get_report_after_rollup_rebuild(self):
+        self.create_order((self.product1, 10), (self.product2, 5))
+        order_id = self.create_order((self.product1, 3))
+        self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+        status_code, content = self.request({'date_from': self.today, 'date_to': self.today})
+
+        DailyProductSales.objects.all().delete()
+        call_command('rebuild_daily_sales', stdout=io.StringIO())
+        self.assertEqual(self.request({'date_from': self.today, 'date_to': self.today}), (status_code, content))
+
+    def test_get_report_csv_stream(self):
+        self.create_order((self.product1, 10), (self.product2, 5))
+        response = self.client.get(reverse('proceeds'),
+                                   data={'date_from': self.today, 'date_to': self.today, 'format': 'csv'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        expected_rows = [[self.product1.id, 0, 10, 1000, 900],
+                         [self.product2.id, 0, 5, 1000, 850]]
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(rows[0], ['product__id', 'refund_products', 'quantity_selled_products', 'proceeds', 'profit'])
+        self.assertEqual([[Decimal(value) for value in row] for row in rows[1:]], expected_rows)
+
+    def test_get_report_ndjson_stream(self):
+        self.create_order((self.product1, 10))
+        response = self.client.get(reverse('proceeds'),
+                                   data={'date_from': self.today, 'date_to': self.today, 'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(rows, [{'product__id': self.product1.id,
+                                 'refund_products': 0,
+                                 'quantity_selled_products': 10,
+                                 'proceeds': 1000.0,
+                                 'profit': 900.0}])
+
+    def test_get_report_keeps_sale_prices(self):
+        self.create_order((self.product1, 10))
+        self.client.put(reverse('update_product_economic_data'),
+                        data={'id': self.product1.id, 'price': 150, 'cost_price': 50}, format='json')
+        order_id = self.create_order((self.product1, 3))
+        self.client.put(reverse('update_product_economic_data'),
+                        data={'id': self.product1.id, 'price': 300, 'cost_price': 100}, format='json')
+        self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+        for engine in Report.available_engines():
+            with self.subTest(engine=engine):
+                status_code, content = self.request({'date_from': self.today, 'date_to': self.today,
+                                                     'engine': engine})
+                self.assertEqual(content['products'], [{'product__id': self.product1.id,
+                                                        'refund_products': 3,
+                                                        'quantity_selled_products': 10,
+                                                        'proceeds': 1000.0,
+                                                        'profit': 900.0}])
+
+    def test_get_report_lines_engine(self):
+        self.create_order((self.product1, 10), (self.product2, 5))
+        order_id = self.create_order((self.product1, 3))
+        self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+        self.assertEqual(self.request({'date_from': self.today, 'date_to': self.today, 'engine': 'lines'}),
+                         self.request({'date_from': self.today, 'date_to': self.today, 'engine': 'sql'}))
+
+    @skipUnless(numpy, 'numpy is not installed')
+    def test_get_report_numpy_engine(self):
+        self.create_order((self.product1, 10), (self.product2, 5))
+        order_id = self.create_order((self.product1, 3))
+        self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+        self.assertEqual(self.request({'date_from': self.today, 'date_to': self.today, 'engine': 'numpy'}),
+                         self.request({'date_from': self.today, 'date_to': self.today, 'engine': 'sql'}))
+        response = self.client.get(reverse('proceeds'), data={'date_from': self.today, 'date_to': self.today,
+                                                              'engine': 'numpy', 'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['quantity_selled_products'] for row in rows], [10, 5])
+
+    @skipUnless(numpy, 'numpy is not installed')
+    def test_get_report_numpy_engine_is_empty_outside_of_date_range(self):
+        self.create_order((self.product1, 10))
+        status_code, content = self.request({'date_from': '01.01.2000', 'date_to': '31.12.2000', 'engine': 'numpy'})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(content['products'], [])
+
+    def test_get_negative_report_unknown_engine(self):
+        status_code, content = self.request({'date_from': self.today, 'date_to': self.today, 'engine': 'spreadsheet'})
+        self.assertEqual(status_code, 400)
+
+    def create_daily_sales(self):
+        for product, day, sold, proceeds, cost in ((self.product1, datetime.date(2021, 7, 5), 2, 200, 20),
+                                                   (self.product1, datetime.date(2021, 7, 6), 1, 100, 10),
+                                                   (self.product1, datetime.date(2021, 8, 2), 1, 100, 10),
+                                                   (self.product2, datetime.date(2021, 7, 13), 5, 1000, 150)):
+            DailyProductSales.objects.create(product=product, day=day, sold=sold, proceeds=proceeds, cost=cost)
+
+    def test_get_report_grouped_by_week(self):
+        self.create_daily_sales()
+        status_code, content = self.request({'date_from': '01.07.2021', 'date_to': '31.08.2021', 'group_by': 'week'})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(content['group_by'], 'week')
+        self.assertEqual([(product['product__id'], [(item['period'], item['quantity_selled_products'], item['profit'])
+                                                    for item in product['series']])
+                          for product in content['products']],
+                         [(self.product1.id, [('2021-07-05', 3, 270.0), ('2021-08-02', 1, 90.0)]),
+                          (self.product2.id, [('2021-07-12', 5, 850.0)])])
+
+    def test_get_report_grouped_by_day_and_month(self):
+        self.create_daily_sales()
+        for group_by, periods in (('day', ['2021-07-05', '2021-07-06', '2021-08-02']),
+                                  ('month', ['2021-07-01', '2021-08-01'])):
+            with self.subTest(group_by=group_by):
+                _, content = self.request({'date_from': '01.07.2021', 'date_to': '31.08.2021', 'group_by': group_by})
+                self.assertEqual([item['period'] for item in content['products'][0]['series']], periods)
+
+    def test_get_report_grouped_top_products_by_profit(self):
+        self.create_daily_sales()
+        _, content = self.request({'date_from': '01.07.2021', 'date_to': '31.08.2021', 'group_by': 'month',
+                                   'top': 1})
+        self.assertEqual([product['product__id'] for product in content['products']], [self.product2.id])
+
+    def test_get_report_grouped_csv_stream(self):
+        self.create_daily_sales()
+        response = self.client.get(reverse('proceeds'), data={'date_from': '01.07.2021', 'date_to': '31.07.2021',
+                                                              'group_by': 'month', 'format': 'csv'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], list(Report.series_fields))
+        self.assertEqual([row[:3] for row in rows[1:]], [[str(self.product1.id), '2021-07-01', '0'],
+                                                         [str(self.product2.id), '2021-07-01', '0']])
+
+    def test_get_negative_report_grouped_invalid_options(self):
+        for options in ({'group_by': 'year'}, {'group_by': 'day', 'top': 0}, {'group_by': 'day', 'top': 'all'},
+                        {'group_by': 'day', 'engine': 'lines'}, {'group_by': 'day', 'date_from': None}):
+            with self.subTest(options=options):
+                data = {key: value for key, value in {'date_from': self.today, 'date_to': self.today,
+                                                      **options}.items() if value is not None}
+                status_code, _ = self.request(data)
+                self.assertEqual(status_code, 400)
+
+    def test_get_report_from_cache(self):
+        self.create_order((self.product1, 10))
+        status_code, content = self.request({'date_from': self.today, 'date_to': self.today})
+        with CaptureQueriesContext(connection) as queries:
+            cached_status_code, cached_content = self.request({'date_from': self.today, 'date_to': self.today})
+        self.assertFalse([query for query in queries if 'store_dailyproductsales' in query['sql']])
+        self.assertEqual((cached_status_code, cached_content), (status_code, content))
+        self.assertEqual(report_cache.stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+        self.request({'date_from': self.today, 'date_to': self.today, 'engine': 'lines'})
+        self.request({'date_from': self.today, 'date_to': self.today, 'group_by': 'day'})
+        self.assertEqual(report_cache.misses, 3)
+
+    def test_report_cache_invalidated_by_order_only_for_periods_covering_its_day(self):
+        today = timezone.localdate()
+        past = {'date_from': '01.01.2000', 'date_to': '31.12.2000'}
+        current = {'date_from': (today - datetime.timedelta(days=40)).strftime('%d.%m.%Y'), 'date_to': self.today}
+        self.create_order((self.product1, 10))
+        self.request(past)
+        self.request(current)
+
+        self.create_order((self.product1, 5))
+        self.request(past)
+        self.assertEqual(report_cache.hits, 1)
+        status_code, content = self.request(current)
+        self.assertEqual(report_cache.hits, 1)
+        self.assertEqual(content['products'][0]['quantity_selled_products'], 15)
+
+    def test_report_cache_invalidated_by_refund(self):
+        order_id = self.create_order((self.product1, 10))
+        self.request({'date_from': self.today, 'date_to': self.today})
+        self.client.patch(reverse('order'), data={'order_id': order_id}, format='json')
+        status_code, content = self.request({'date_from': self.today, 'date_to': self.today})
+        self.assertEqual(content['products'][0]['refund_products'], 10)
+
+    def test_report_cache_period_version_keys(self):
+        version_keys = report_cache.period_version_keys(datetime.date(2019, 12, 30), datetime.date(2021, 3, 3))
+        self.assertEqual(version_keys, ['report:version:day:2019-12-30',
+                                        'report:version:day:2019-12-31',
+                                        'report:version:year:2020',
+                                        'report:version:month:2021-01',
+                                        'report:version:month:2021-02',
+                                        'report:version:day:2021-03-01',
+                                        'report:version:day:2021-03-02'])
+
+    def test_get_report_cache_stats(self):
+        self.request({'date_from': self.today, 'date_to': self.today})
+        self.request({'date_from': self.today, 'date_to': self.today})
+        response = self.client.get(reverse('report_cache_stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5, 'process': os.getpid()})
+
+    def test_report_cache_invalidated_by_worker_with_its_own_cache_instance(self):
+        self.create_order((self.product1, 10))
+        self.request({'date_from': self.today, 'date_to': self.today})
+        self.client.post(reverse('cart'), data={"product_id": self.product1.id, "quantity_to_buy": 5}, format='json')
+        self.client.post(reverse('order'), data={"customer_name": "test_name",
+                                                 "email": "test@email.com",
+                                                 "address": "test street",
+                                                 "postal_code": 123456,
+                                                 "city": "test_city"}, format='json')
+        # built after the order, before the worker booked its sales
+        response = self.client.generic('GET', reverse('proceeds'),
+                                       json.dumps({'date_from': self.today, 'date_to': self.today}),
+                                       content_type='application/json')
+        self.assertEqual(response.json()['products'][0]['quantity_selled_products'], 10)
+        worker_cache = caches.create_connection(settings.REPORT_CACHE_ALIAS)
+        with mock.patch.object(ReportCache, 'shared', new_callable=mock.PropertyMock, return_value=worker_cache):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(job_queue.run_pending(), 1)
+        status_code, content = self.request({'date_from': self.today, 'date_to': self.today})
+        self.assertEqual(content['products'][0]['quantity_selled_products'], 15)
+
+    def test_negative_report_cache_in_local_memory_is_refused(self):
+        self.assertEqual(check_report_cache(None), [])
+        with override_settings(REPORT_CACHE_ALIAS='default'):
+            self.assertEqual([error.id for error in check_report_cache(None)], ['store.E001'])
+
+    def test_get_negative_report_csv_without_date_range(self):
+        response = self.client.get(reverse('proceeds'), data={'format': 'csv'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content.decode(), 'detail\r\nNo date range was specified\r\n')
+
+    def test_get_negative_report_without_date_range(self):
+        status_code, content = self.request({})
+        self.assertEqual(content['detail'], 'No date range was specified')
+        self.assertEqual(status_code, 400)
@@ -1,64 +1,232 @@
 from decimal import Decimal
 
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
 
-from store.models import Product
+from store.models import Product, CartLine
 
 
-class Cart(object):
+def to_cents(price):
+    return int(Decimal(price) * 100)
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+class SessionCartStorage(object):
+    """
+    Keeps cart lines in the session as {"product_id": [quantity, price_in_cents]}
+    """
 
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        lines = self.session.get(settings.CART_SESSION_ID)
+        if not lines:
+            lines = self.session[settings.CART_SESSION_ID] = {}
+        elif any(isinstance(line, dict) for line in lines.values()):
+            # carts saved before lines were compacted
+            lines = self.session[settings.CART_SESSION_ID] = {
+                product_id: [line.get('quantity'), to_cents(line.get('price'))] for product_id, line in lines.items()}
+        self.lines = lines
+
+    def __iter__(self):
+        for product_id, (quantity, price_cents) in self.lines.items():
+            yield int(product_id), quantity, price_cents
+
+    def get(self, product_id):
+        return tuple(self.lines.get(str(product_id), (0, 0)))
+
+    def set(self, product_id, quantity, price_cents):
+        self.set_many({product_id: (quantity, price_cents)})
+
+    def set_many(self, lines):
+        for product_id, (quantity, price_cents) in lines.items():
+            self.lines[str(product_id)] = [quantity, price_cents]
+        self.session[settings.CART_SESSION_ID] = self.lines
+
+    def remove(self, product_id):
+        if self.lines.pop(str(product_id), None) is not None:
+            self.session.modified = True
+
+    def clear(self):
+        self.session.pop(settings.CART_SESSION_ID, None)
+        self.lines = {}
+        self.session.modified = True
+
+
+class DatabaseCartStorage(object):
+    """
+    Keeps cart lines in CartLine table keyed by session key, every change writes only its own line
+    """
+
+    def __init__(self, request):
+        if request.session.session_key is None:
+            request.session.save()
+        self.session_key = request.session.session_key
+        self._lines = None
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = {product_id: (quantity, price_cents)
+                           for product_id, quantity, price_cents in CartLine.objects.filter(
+                               session_key=self.session_key).values_list('product_id', 'quantity', 'price_cents')}
+        return self._lines
+
+    def __iter__(self):
+        for product_id, (quantity, price_cents) in self.lines.items():
+            yield product_id, quantity, price_cents
+
+    def get(self, product_id):
+        return self.lines.get(int(product_id), (0, 0))
+
+    def set(self, product_id, quantity, price_cents):
+        product_id = int(product_id)
+        if product_id in self.lines:
+            self.update(product_id, quantity, price_cents)
+        else:
+            try:
+                with transaction.atomic():
+                    CartLine.objects.create(session_key=self.session_key, product_id=product_id,
+                                            quantity=quantity, price_cents=price_cents)
+            except IntegrityError:
+                # a concurrent request of this session added the line, e.g. a double click
+                self.update(product_id, quantity, price_cents)
+        self.lines[product_id] = (quantity, price_cents)
+
+    def update(self, product_id, quantity, price_cents):
+        CartLine.objects.filter(session_key=self.session_key, product_id=product_id).update(
+            quantity=quantity, price_cents=price_cents)
+
+    @transaction.atomic
+    def set_many(self, lines):
+        lines = {int(product_id): line for product_id, line in lines.items()}
+        changed = CartLine.objects.filter(session_key=self.session_key,
+                                          product_id__in=[id_ for id_ in lines if id_ in self.lines])
+        for cart_line in changed:
+            cart_line.quantity, cart_line.price_cents = lines[cart_line.product_id]
+        CartLine.objects.bulk_update(changed, ['quantity', 'price_cents'])
+        added = {product_id: line for product_id, line in lines.items() if product_id not in self.lines}
+        try:
+            with transaction.atomic():
+                CartLine.objects.bulk_create([CartLine(session_key=self.session_key, product_id=product_id,
+                                                       quantity=quantity, price_cents=price_cents)
+                                              for product_id, (quantity, price_cents) in added.items()])
+        except IntegrityError:
+            # a concurrent request of this session added some of the lines
+            for product_id, (quantity, price_cents) in added.items():
+                self.set(product_id, quantity, price_cents)
+        self.lines.update(lines)
+
+    def remove(self, product_id):
+        product_id = int(product_id)
+        if self.lines.pop(product_id, None) is not None:
+            CartLine.objects.filter(session_key=self.session_key, product_id=product_id).delete()
+
+    def clear(self):
+        CartLine.objects.filter(session_key=self.session_key).delete()
+        self._lines = {}
+
+
+class Cart(object):
+    hydrated_fields = ('id', 'price', 'cost_price', 'quantity')
+
+    def __init__(self, request):
+        self.storage = import_string(settings.CART_STORAGE_BACKEND)(request)
+        self._lines = None
 
     def add(self, product, quantity_to_buy=1):
-        product_id = str(product.get('id'))
+        product_id = product.get('id')
         product_quantity = product.get('quantity')
-        product_price = product.get('price')
-        try:
-            if quantity_to_buy > product_quantity - self.cart[product_id]['quantity']:
-                return False
-            self.cart[product_id]['quantity'] += quantity_to_buy
-        except KeyError:
-            if quantity_to_buy > product_quantity:
-                return False
-            self.cart[product_id] = {'quantity': quantity_to_buy,
-                                     'price': product_price}
-        self.save()
-        return self.cart
-
-    def save(self):
-        self.session[settings.CART_SESSION_ID] = self.cart
-        self.session.modified = True
+        quantity_in_cart, _ = self.storage.get(product_id)
+        if quantity_to_buy > product_quantity - quantity_in_cart:
+            return False
+        self.storage.set(product_id, quantity_in_cart + quantity_to_buy, to_cents(product.get('price')))
+        self._lines = None
+        return self.as_dict()
+
+    def add_many(self, lines):
+        """
+        Add several (product, quantity_to_buy) lines with one storage write.
+        Every line is checked against stock the same way as in add().
+        Return accepted flag for every line, None for lines without product
+        """
+        pending = {}
+        accepted = []
+        for product, quantity_to_buy in lines:
+            if product is None:
+                accepted.append(None)
+                continue
+            product_id = product.get('id')
+            quantity_in_cart, _ = pending.get(product_id) or self.storage.get(product_id)
+            if quantity_to_buy > product.get('quantity') - quantity_in_cart:
+                accepted.append(False)
+                continue
+            pending[product_id] = (quantity_in_cart + quantity_to_buy, to_cents(product.get('price')))
+            accepted.append(True)
+        if pending:
+            self.storage.set_many(pending)
+            self._lines = None
+        return accepted
 
     def remove(self, product):
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+        self.storage.remove(product.id)
+        self._lines = None
 
-    def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        for product in products:
-            self.cart[str(product.id)]['product'] = product
+    def as_dict(self):
+        """
+        Cart lines as they are shown to the client
+        """
+        return {str(product_id): {'quantity': quantity, 'price': str(from_cents(price_cents))}
+                for product_id, quantity, price_cents in self.storage}
 
-        for item in self.cart.values():
-            item['price'] = Decimal(item.get('price'))
-            item['total_price'] = item.get('price') * item.get('quantity')
-            yield item
+    def hydrate(self):
+        """
+        Load products of all lines with one query and count line totals in cents.
+        The result is kept until the cart changes
+        """
+        if self._lines is None:
+            stored_lines = {product_id: (quantity, price_cents) for product_id, quantity, price_cents in self.storage}
+            products = Product.objects.only(*self.hydrated_fields).filter(id__in=stored_lines)
+            lines = []
+            for product in products:
+                quantity, price_cents = stored_lines[product.id]
+                lines.append({'product': product,
+                              'quantity': quantity,
+                              'price_cents': price_cents,
+                              'total_cents': price_cents * quantity,
+                              'current_price_cents': to_cents(product.price)})
+            # assigned only once the query succeeded, so a failed load is retried
+            self._lines = lines
+        return self._lines
+
+    def __iter__(self):
+        for line in self.hydrate():
+            yield {'product': line['product'],
+                   'quantity': line['quantity'],
+                   'price': from_cents(line['price_cents']),
+                   'total_price': from_cents(line['total_cents'])}
 
     def __len__(self):
-        return sum(item.get('quantity') for item in self.cart.values())
+        return sum(quantity for _, quantity, _ in self.storage)
 
     def get_product_total_price(self, product):
-        product_price = self.cart[str(product.id)].get('price')
-        product_quantity = self.cart[str(product.id)].get('quantity')
-        return Decimal(product_price * product_quantity)
+        quantity, price_cents = self.storage.get(product.id)
+        return from_cents(price_cents * quantity)
+
+    def get_total_price(self):
+        return from_cents(sum(line['total_cents'] for line in self.hydrate()))
+
+    def get_stale_prices(self):
+        """
+        Lines added to cart before the product price changed
+        """
+        return {line['product'].id: {'cart_price': str(from_cents(line['price_cents'])),
+                                     'price': str(from_cents(line['current_price_cents']))}
+                for line in self.hydrate() if line['price_cents'] != line['current_price_cents']}
 
     def clear(self):
-        del self.session[settings.CART_SESSION_ID]
-        self.session.modified = True
+        self.storage.clear()
+        self._lines = None
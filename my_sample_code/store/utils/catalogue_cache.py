@@ -0,0 +1,146 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from store.utils.db_routing import replica_routing
+
+
+class LRUCache:
+    """
+    Small in-process cache that forgets least recently used entries first
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class CatalogueCache:
+    """
+    Serialized product pages and products in an in-process LRU tier in front of a shared cache.
+    Keys carry a version that is replaced on every change of a product, so nothing is deleted:
+    outdated entries simply stop being looked up and expire
+    """
+    list_version_key = 'catalogue:version:list'
+    product_version_key = 'catalogue:version:product:{}'
+    changed_at_key = 'catalogue:changed_at'
+
+    def __init__(self, alias, timeout, local_max_entries):
+        self.alias = alias
+        self.timeout = timeout
+        self.local = LRUCache(local_max_entries)
+        self.local_hits = self.shared_hits = self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def get_version(self, version_key):
+        version = self.shared.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not self.shared.add(version_key, version, timeout=None):
+                version = self.shared.get(version_key, version)
+        return version
+
+    def list_key(self, request):
+        params = sorted((name, values) for name, values in request.query_params.lists())
+        digest = hashlib.sha1(repr((request.get_host(), params)).encode()).hexdigest()
+        return f'catalogue:list:{self.get_version(self.list_version_key)}:{digest}'
+
+    def product_key(self, product_id):
+        version = self.get_version(self.product_version_key.format(product_id))
+        return f'catalogue:product:{product_id}:{version}'
+
+    def get(self, key):
+        data = self.local.get(key)
+        if data is not None:
+            self.local_hits += 1
+            return data
+        data = self.shared.get(key)
+        if data is not None:
+            self.shared_hits += 1
+            self.local.set(key, data)
+            return data
+        self.misses += 1
+        return None
+
+    def set(self, key, data):
+        self.local.set(key, data)
+        self.shared.set(key, data, timeout=self.timeout)
+
+    def invalidate(self, product_ids=()):
+        """
+        Drop cached pages and given products now and once more after commit,
+        so a page read from not yet committed data does not outlive the transaction
+        """
+        self.bump_versions(product_ids)
+        transaction.on_commit(lambda: self.bump_versions(product_ids))
+
+    def bump_versions(self, product_ids):
+        version_keys = [self.list_version_key, *(self.product_version_key.format(id_) for id_ in product_ids)]
+        self.shared.set_many({**{key: uuid.uuid4().hex for key in version_keys}, self.changed_at_key: time.time()},
+                             timeout=None)
+
+    def respond(self, request, key, build_response):
+        """
+        Return 304 when client already has the page, cached data when we have it,
+        otherwise build the response and cache it
+        """
+        etag = quote_etag(hashlib.sha1(key.encode()).hexdigest())
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            self.local_hits += 1
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        data = self.get(key)
+        if data is None:
+            with replica_routing.after_change(lambda: self.shared.get(self.changed_at_key)):
+                response = build_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            self.set(key, response.data)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.local_hits + self.shared_hits) / lookups if lookups else 0.0}
+
+
+catalogue_cache = CatalogueCache(settings.CATALOGUE_CACHE_ALIAS,
+                                 settings.CATALOGUE_CACHE_TIMEOUT,
+                                 settings.CATALOGUE_CACHE_LOCAL_ENTRIES)
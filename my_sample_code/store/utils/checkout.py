@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.utils import timezone
+
+from store.models import Product, Order, OrderProduct, Job
+from store.utils.metrics import metrics
+from store.utils.report_cache import report_cache
+
+
+class NothingToSellError(Exception):
+    """
+    Raised when none of the cart lines can be sold, the order is not created then
+    """
+
+    def __init__(self, not_selled_products):
+        super().__init__('None of the cart products can be sold')
+        self.not_selled_products = not_selled_products
+
+
+class Checkout(object):
+    """
+    Turns a cart into an order: reserves stock, creates the order and its lines and enqueues
+    order_created job in one transaction. The number of queries does not depend on the number of cart lines
+    """
+
+    def __init__(self, cart):
+        self.cart = cart
+
+    def place_order(self, order_data):
+        """
+        Create order from validated order data with every cart line we can sell.
+        Return order, sold lines ({product_id: {'quantity', 'total_price'}}) and stock left for lines
+        that can not be sold. Nothing is written when there are lines and none of them can be sold
+        """
+        cart_lines = list(self.cart)
+        with transaction.atomic():
+            reserved, not_selled_products = Product.objects.reserve(
+                {line['product'].id: line['quantity'] for line in cart_lines})
+            if not_selled_products and not reserved:
+                metrics.inc('store_order_lines_unsold_total', len(not_selled_products))
+                raise NothingToSellError(not_selled_products)
+            order = Order.objects.create(**order_data)
+            selled_products = {}
+            order_products = []
+            daily_sales = {}
+            for line in cart_lines:
+                product, quantity, total_price = line['product'], line['quantity'], line['total_price']
+                if product.id not in reserved:
+                    continue
+                order_products.append(OrderProduct(order=order, product=product, quantity=quantity,
+                                                   unit_price=line['price'], unit_cost=product.cost_price))
+                selled_products[product.id] = {'quantity': quantity, 'total_price': total_price}
+                daily_sales[product.id] = (quantity, 0, total_price, product.cost_price * quantity)
+            OrderProduct.objects.bulk_create(order_products)
+            report_cache.invalidate([timezone.localdate(order.created)])
+            Job.objects.enqueue('order_created', order_id=order.id, day=timezone.localdate(order.created),
+                                sales=daily_sales)
+            counts = {'store_orders_created_total': 1,
+                      'store_order_lines_sold_total': len(order_products),
+                      'store_order_lines_unsold_total': len(not_selled_products)}
+            transaction.on_commit(lambda: metrics.add(counts))
+        return order, selled_products, not_selled_products
@@ -0,0 +1,110 @@
+import contextlib
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+class ReplicaRouting:
+    """
+    Chooses the database reads of the current request go to. Views opt in with ReplicaReadsMixin, everything else
+    and every write use 'default'.
+    A client that wrote keeps reading from 'default' for DATABASE_REPLICA_LAG seconds, remembered in a cookie,
+    so cart and order flows never see stock older than their own changes
+    """
+    cookie_name = 'primary_reads_until'
+
+    def __init__(self):
+        self.alias = contextvars.ContextVar('replica_alias', default=None)
+
+    @property
+    def replicas(self):
+        return settings.DATABASE_REPLICAS
+
+    @property
+    def lag(self):
+        return settings.DATABASE_REPLICA_LAG
+
+    @contextlib.contextmanager
+    def using(self, alias):
+        token = self.alias.set(alias)
+        try:
+            yield alias
+        finally:
+            self.alias.reset(token)
+
+    def use_replica(self, request):
+        """
+        Context in which reads of a safe request go to one replica, chosen once so all reads see the same data
+        """
+        alias = None
+        if self.replicas and request.method in SAFE_METHODS and not self.is_pinned(request):
+            alias = random.choice(self.replicas)
+        return self.using(alias)
+
+    def after_change(self, changed_at):
+        """
+        Context for building data that is cached under versions of the latest change: a replica may not have
+        a change younger than DATABASE_REPLICA_LAG seconds yet, so reads go to 'default' then.
+        changed_at is a callable returning the time of the change, called only when reading from a replica
+        """
+        if self.alias.get() is None:
+            return contextlib.nullcontext()
+        timestamp = changed_at()
+        if timestamp is not None and time.time() - timestamp < self.lag:
+            return self.using(None)
+        return contextlib.nullcontext()
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def pin(self, response):
+        response.set_cookie(self.cookie_name, f'{time.time() + self.lag:.3f}', max_age=self.lag,
+                            httponly=True, samesite='Lax')
+
+
+class ReplicaRouter:
+    """
+    Reads go to the database chosen by replica_routing, writes and migrations to 'default' only:
+    an object read from a replica is saved to 'default' too
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = replica_routing.alias.get()
+        if alias is not None and connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # reads inside a transaction have to see its writes
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_routing.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_routing.replicas:
+            return False
+        return None
+
+
+class ReplicaReadsMixin:
+    """
+    Safe requests of the view read from a replica
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_routing.use_replica(request):
+            return super().dispatch(request, *args, **kwargs)
+
+
+replica_routing = ReplicaRouting()
@@ -0,0 +1,133 @@
+import datetime
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from store.models import IdempotencyKey
+
+
+class IdempotentResponses:
+    """
+    Handles a request sent with Idempotency-Key header once and replays its response to retries of the same client:
+    keys are scoped by the user, or the session of an anonymous client, so another client never gets the response.
+    Keys of a client without a session are scoped by the key alone, the fingerprint still keeps a request
+    with another body from getting the response.
+    The key is claimed with a unique insert before the request is handled, so a concurrent duplicate
+    finds the claim and waits for the stored response instead of handling the request again.
+    Only successful responses are stored, the key of a request that failed, with a response or an exception,
+    is released for a retry
+    """
+    header = 'HTTP_IDEMPOTENCY_KEY'
+    max_key_length = 255
+    poll_interval = 0.05
+
+    def __init__(self, ttl, wait_timeout, lock_timeout):
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.wait_timeout = wait_timeout
+        self.lock_timeout = datetime.timedelta(seconds=lock_timeout)
+
+    def respond(self, request, handle):
+        """
+        Return stored response for a known key, otherwise handle the request and store its response.
+        Requests without the header are simply handled
+        """
+        key = request.META.get(self.header)
+        if key is None:
+            return handle()
+        if not key or len(key) > self.max_key_length:
+            return Response({'detail': f'Idempotency-Key must be 1 to {self.max_key_length} characters long'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        client = self.client(request)
+        fingerprint = self.fingerprint(request)
+        deadline = time.monotonic() + self.wait_timeout
+        record, owner = self.claim(client, key, fingerprint)
+        while not owner:
+            if record is not None:
+                if record.fingerprint != fingerprint:
+                    return Response({'detail': 'Idempotency-Key was already used with another request'},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                if record.response_status is not None:
+                    return Response(record.response_data, status=record.response_status,
+                                    headers={'Idempotent-Replayed': 'true'})
+                if time.monotonic() >= deadline:
+                    return Response({'detail': 'A request with this Idempotency-Key is still in progress'},
+                                    status=status.HTTP_409_CONFLICT)
+                time.sleep(self.poll_interval)
+            record, owner = self.claim(client, key, fingerprint)
+
+        try:
+            response = handle()
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= status.HTTP_400_BAD_REQUEST:
+            # failed requests change nothing and are not stored, retry may succeed
+            record.delete()
+            return response
+        IdempotencyKey.objects.filter(id=record.id).update(response_status=response.status_code,
+                                                           response_data=self.to_json(response.data))
+        return response
+
+    def claim(self, client, key, fingerprint):
+        """
+        Return the record of the client's key and whether this request owns it.
+        Expired keys and keys of requests lost in progress are taken over
+        """
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(client=client, key=key, fingerprint=fingerprint,
+                                                     created=now, expires=now + self.ttl), True
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(client=client, key=key).first()
+        if record is None:
+            return None, False
+        if record.expires <= now or (record.response_status is None and record.created <= now - self.lock_timeout):
+            taken = IdempotencyKey.objects.filter(id=record.id, created=record.created).update(
+                fingerprint=fingerprint, response_status=None, response_data=None,
+                created=now, expires=now + self.ttl)
+            if taken:
+                record.fingerprint, record.response_status, record.response_data = fingerprint, None, None
+                record.created, record.expires = now, now + self.ttl
+                return record, True
+            return None, False
+        return record, False
+
+    @staticmethod
+    def client(request):
+        """
+        'user:<id>' of an authenticated user, 'session:<key>' of a client with a session, otherwise 'anonymous'.
+        No session is created here: a client without cookies would retry without it and miss its key
+        """
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        session_key = request.session.session_key
+        if session_key is None:
+            return 'anonymous'
+        return f'session:{session_key}'
+
+    @staticmethod
+    def fingerprint(request):
+        payload = json.dumps([request.method, request.path, request.data], sort_keys=True, cls=JSONEncoder)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def to_json(data):
+        """
+        Data as the client got it, Decimal and datetime values are stored the way JSONRenderer renders them
+        """
+        return json.loads(json.dumps(data, cls=JSONEncoder))
+
+
+idempotent_responses = IdempotentResponses(settings.IDEMPOTENCY_KEY_TTL,
+                                           settings.IDEMPOTENCY_KEY_WAIT,
+                                           settings.IDEMPOTENCY_KEY_LOCK_TIMEOUT)
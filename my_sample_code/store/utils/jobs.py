@@ -0,0 +1,85 @@
+import datetime
+import logging
+import traceback
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from store.models import Job, DailyProductSales
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    Runs jobs stored in Job table. A job is locked, handled and marked done in one transaction,
+    so a worker that dies halfway leaves the job pending and nothing of its work committed
+    """
+
+    def __init__(self, max_attempts, retry_delay):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.handlers = {}
+
+    def handler(self, name):
+        """
+        Register function handling jobs with this name, it gets job payload as keyword arguments
+        """
+        def register(func):
+            self.handlers[name] = func
+            return func
+        return register
+
+    def run_next(self):
+        """
+        Run the oldest due job not locked by another worker, return False when there is none
+        """
+        with transaction.atomic():
+            job = Job.objects.due().select_for_update(skip_locked=True).first()
+            if job is None:
+                return False
+            job.attempts += 1
+            try:
+                with transaction.atomic():
+                    self.handlers[job.name](**job.payload)
+            except Exception:
+                logger.exception('Job %s failed, attempt %s', job, job.attempts)
+                job.error = traceback.format_exc()
+                if job.attempts >= self.max_attempts:
+                    job.status = Job.FAILED
+                else:
+                    job.run_after = timezone.now() + datetime.timedelta(seconds=self.retry_delay * job.attempts)
+            else:
+                job.status = Job.DONE
+                job.finished = timezone.now()
+            job.save(update_fields=['status', 'attempts', 'error', 'run_after', 'finished'])
+        return True
+
+    def run_pending(self):
+        """
+        Run jobs until none is due, return the number of jobs run
+        """
+        ran = 0
+        while self.run_next():
+            ran += 1
+        return ran
+
+
+job_queue = JobQueue(settings.JOB_MAX_ATTEMPTS, settings.JOB_RETRY_DELAY)
+
+
+def daily_sales(sales):
+    return {int(product_id): (sold, refunded, Decimal(proceeds), Decimal(cost))
+            for product_id, (sold, refunded, proceeds, cost) in sales.items()}
+
+
+@job_queue.handler('order_created')
+def book_order_sales(order_id, day, sales):
+    DailyProductSales.objects.record(datetime.date.fromisoformat(day), daily_sales(sales))
+
+
+@job_queue.handler('orders_returned')
+def book_order_refunds(order_ids, day, sales):
+    DailyProductSales.objects.record(datetime.date.fromisoformat(day), daily_sales(sales))
@@ -0,0 +1,125 @@
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """
+    Counts of observed values per bucket, buckets are upper bounds. The counts list is allocated once,
+    an observation increments one of its ints
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        [(upper bound, observations up to it)] ending with '+Inf', as Prometheus expects
+        """
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class RouteMetrics:
+    """
+    Request latency, SQL queries and response status classes of one route and HTTP method
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = Histogram(LATENCY_BUCKETS)
+        # responses by status class: 1xx, 2xx, 3xx, 4xx, 5xx
+        self.statuses = [0] * 5
+
+    def observe(self, seconds, queries, query_seconds, status_code):
+        with self.lock:
+            self.latency.observe(seconds)
+            self.queries.observe(queries)
+            self.query_seconds.observe(query_seconds)
+            self.statuses[min(max(status_code // 100, 1), 5) - 1] += 1
+
+
+class Metrics:
+    """
+    In-process metrics rendered in Prometheus text format. Every process keeps its own numbers,
+    so each worker of a server has to be scraped.
+    SQL queries of a request are counted by MetricsMiddleware with an execute wrapper of every connection
+    """
+    counters = {
+        'store_orders_created_total': 'Orders created',
+        'store_order_lines_sold_total': 'Order lines sold',
+        'store_order_lines_unsold_total': 'Cart lines that could not be sold when an order was created',
+        'store_orders_refunded_total': 'Orders returned',
+        'session_read_bytes_total': 'Bytes of session data decoded',
+        'session_write_bytes_total': 'Bytes of session data encoded to be saved',
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.values = dict.fromkeys(self.counters, 0)
+        self.collectors = []
+
+    def route(self, view_name, method):
+        key = (view_name, method)
+        route = self.routes.get(key)
+        if route is None:
+            with self.lock:
+                route = self.routes.setdefault(key, RouteMetrics())
+        return route
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.values[name] += value
+
+    def add(self, values):
+        with self.lock:
+            for name, value in values.items():
+                self.values[name] += value
+
+    def collector(self, prefix, stats):
+        """
+        Export numbers returned by stats() as gauges named prefix_<key> on every scrape
+        """
+        self.collectors.append((prefix, stats))
+
+    def render(self):
+        lines = []
+        for name, description in self.counters.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter', f'{name} {self.values[name]}']
+        routes = sorted(self.routes.items())
+        for name, attribute, description in (
+                ('http_request_duration_seconds', 'latency', 'Request latency by route'),
+                ('db_queries_per_request', 'queries', 'SQL queries run by one request'),
+                ('db_query_duration_seconds_per_request', 'query_seconds', 'Seconds one request spent in SQL')):
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for (view_name, method), route in routes:
+                labels = f'route="{view_name}",method="{method}"'
+                histogram = getattr(route, attribute)
+                lines += [f'{name}_bucket{{{labels},le="{bound}"}} {count}' for bound, count in histogram.cumulative()]
+                lines += [f'{name}_sum{{{labels}}} {histogram.sum}',
+                          f'{name}_count{{{labels}}} {sum(histogram.counts)}']
+        lines += ['# HELP http_responses_total Responses by route and status class',
+                  '# TYPE http_responses_total counter']
+        for (view_name, method), route in routes:
+            lines += [f'http_responses_total{{route="{view_name}",method="{method}",status="{number}xx"}} {count}'
+                      for number, count in enumerate(route.statuses, 1) if count]
+        for prefix, stats in self.collectors:
+            for key, value in stats().items():
+                lines += [f'# TYPE {prefix}_{key} gauge', f'{prefix}_{key} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,125 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks to the page with a WHERE on the ordering fields
+    instead of an OFFSET, so page N costs the same as page 1.
+    The ordering set by OrderingFilter always gets an id tie-breaker, cursors are opaque
+    """
+    cursor_query_param = 'cursor'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    tie_breaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor = self.decode_cursor(request, self.get_ordering(queryset))
+        page = list(self.page_queryset(queryset, request, cursor))
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if self.reverse:
+            page.reverse()
+
+        self.next_position = self.previous_position = None
+        if page and (has_more if not self.reverse else True):
+            self.next_position = self.get_position(page[-1])
+        if page and cursor and (has_more if self.reverse else True):
+            self.previous_position = self.get_position(page[0])
+        return page
+
+    def page_queryset(self, queryset, request, cursor=None):
+        """
+        Query of the page at cursor, one row more than the page size tells whether there is a next page
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.reverse = bool(cursor and cursor['reverse'])
+
+        ordering = [self.invert(field) for field in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            queryset = queryset.filter(self.seek(ordering, cursor['position']))
+        return queryset[:self.page_size + 1]
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_link(self.next_position, reverse=False),
+                         'previous': self.get_link(self.previous_position, reverse=True),
+                         'results': data})
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not any(field.lstrip('-') in (self.tie_breaker, 'pk') for field in ordering):
+            direction = '-' if ordering and ordering[-1].startswith('-') else ''
+            ordering.append(direction + self.tie_breaker)
+        return ordering
+
+    def get_position(self, item):
+        return [self.to_json(getattr(item, field.lstrip('-'))) for field in self.ordering]
+
+    def seek(self, ordering, position):
+        """
+        Rows after position for ordering (a, b, id):
+        a >= x AND (a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)).
+        The leading a >= x bounds the index range, without it the OR makes the database walk the index from its start
+        """
+        first = ordering[0]
+        bound = Q(**{f'{first.lstrip("-")}__{"lte" if first.startswith("-") else "gte"}': position[0]})
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {other.lstrip('-'): value for other, value in zip(ordering[:index], position[:index])}
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': position[index]}))
+        return bound & reduce(or_, conditions)
+
+    def decode_cursor(self, request, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            cursor = {'ordering': cursor['o'], 'position': cursor['p'], 'reverse': bool(cursor['r'])}
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor['ordering'] != ordering or len(cursor['position']) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, position, reverse):
+        cursor = json.dumps({'o': self.ordering, 'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(cursor.encode()).decode('ascii')
+
+    def get_link(self, position, reverse):
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def to_json(value):
+        return value if isinstance(value, (int, str)) else str(value)
@@ -0,0 +1,131 @@
+import csv
+import json
+import time
+
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from store.models import Product
+from store.serializers import ProductImportSerializer
+from store.utils.catalogue_cache import catalogue_cache
+
+
+class ProductImportResult:
+
+    def __init__(self):
+        self.rows = self.created = self.updated = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds) if self.seconds else 0
+
+    def as_dict(self):
+        return {'rows': self.rows,
+                'created': self.created,
+                'updated': self.updated,
+                'errors': self.errors,
+                'seconds': round(self.seconds, 3),
+                'rows_per_second': self.rows_per_second}
+
+
+class ProductImporter:
+    """
+    Reads products from CSV or NDJSON stream chunk by chunk and upserts them on vendor_code.
+    Invalid rows are reported with their line number and skipped, the rest of the chunk is saved.
+    Files are UTF-8: an undecodable NDJSON line is an invalid row, an unreadable CSV line is reported as a row error
+    and ends the import, rows before it are saved
+    """
+    formats = ('csv', 'ndjson')
+    fields = ProductImportSerializer.Meta.fields
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def run(self, stream, data_format):
+        result = ProductImportResult()
+        batch = []
+        for row_number, row in self.read_rows(stream, data_format, result):
+            batch.append((row_number, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch, result)
+                batch = []
+        if batch:
+            self.import_batch(batch, result)
+        result.seconds = time.perf_counter() - result.started
+        return result
+
+    def read_rows(self, stream, data_format, result):
+        if data_format not in self.formats:
+            raise ValueError(f'Unknown format {data_format}, expected one of {", ".join(self.formats)}')
+        if data_format == 'csv':
+            # lines are decoded one by one, so rows before an undecodable line are still read
+            reader = csv.DictReader(line.decode('utf-8') for line in stream)
+            try:
+                for row in reader:
+                    yield reader.line_num, row
+            except (UnicodeDecodeError, csv.Error) as error:
+                # the reader can not find the start of the next row, the rest of the file is skipped
+                result.rows += 1
+                result.errors.append({'row': reader.line_num + 1, 'errors': {'non_field_errors': [
+                    f'File can not be read from this row on: {error}']}})
+            return
+        for row_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line.decode('utf-8'))
+            except ValueError as error:  # UnicodeDecodeError is a ValueError too
+                result.rows += 1
+                result.errors.append({'row': row_number, 'errors': {'non_field_errors': [str(error)]}})
+                continue
+            yield row_number, row
+
+    def import_batch(self, batch, result):
+        result.rows += len(batch)
+        serializer = ProductImportSerializer()
+        products = {}
+        for row_number, row in batch:
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as error:
+                result.errors.append({'row': row_number, 'errors': error.detail})
+                continue
+            products[data['vendor_code']] = data
+        if products:
+            self.upsert(products, result)
+
+    @transaction.atomic
+    def upsert(self, products, result):
+        existing = dict(Product.objects.filter(vendor_code__in=products).values_list('vendor_code', 'id'))
+        # rows may leave optional columns out, existing products keep their current values of those
+        by_fields = {}
+        for data in products.values():
+            by_fields.setdefault(tuple(sorted(data)), []).append(data)
+        with connection.cursor() as cursor:
+            for supplied_fields, rows in by_fields.items():
+                batch_size = min(self.batch_size, connection.ops.bulk_batch_size(self.fields, rows))
+                for start in range(0, len(rows), batch_size):
+                    cursor.execute(*self.upsert_sql(supplied_fields, rows[start:start + batch_size]))
+        catalogue_cache.invalidate(existing.values())
+        result.updated += len(existing)
+        result.created += len(products) - len(existing)
+
+    def upsert_sql(self, supplied_fields, rows):
+        """
+        INSERT ... ON CONFLICT (vendor_code) DO UPDATE, the statement bulk_create(update_conflicts=True)
+        builds since Django 4.1. Postgres and SQLite share this syntax
+        """
+        quote = connection.ops.quote_name
+        fields = [Product._meta.get_field(name) for name in self.fields]
+        columns = ', '.join(quote(field.column) for field in fields)
+        values = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(rows))
+        updates = ', '.join(f'{quote(field.column)} = EXCLUDED.{quote(field.column)}'
+                            for field in fields if field.name in supplied_fields and field.name != 'vendor_code')
+        sql = (f'INSERT INTO {quote(Product._meta.db_table)} ({columns}) VALUES {values} '
+               f'ON CONFLICT ({quote("vendor_code")}) DO UPDATE SET {updates}')
+        params = [field.get_db_prep_save(row[field.name] if field.name in row else field.get_default(), connection)
+                  for row in rows for field in fields]
+        return sql, params
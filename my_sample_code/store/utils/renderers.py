@@ -0,0 +1,77 @@
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, without it FastJSONRenderer renders with json as JSONRenderer does
+    orjson = None
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    Renders a list of rows either at once or as a stream of encoded rows
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0]) if rows else []
+        return b''.join(self.stream(rows, fields))
+
+    def stream(self, rows, fields):
+        raise NotImplementedError('Renderer class requires .stream() to be implemented')
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows, fields):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        yield self.flush(buffer)
+        for row in rows:
+            writer.writerow(row)
+            yield self.flush(buffer)
+
+    def flush(self, buffer):
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line.encode(self.charset)
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, rows, fields):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        for row in rows:
+            yield (encoder.encode(row) + '\n').encode(self.charset)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders the same bytes as JSONRenderer with orjson, when it is installed and the output is compact UTF-8.
+    Types orjson does not know go through the DRF encoder, data it can not encode is rendered by JSONRenderer.
+    orjson writes floats in its own way (1e16 instead of 1e+16, null for NaN): use it for data without floats
+    """
+    options = 0 if orjson is None else orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            rendered = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # as JSONRenderer, keep the output a strict javascript subset
+        return rendered.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
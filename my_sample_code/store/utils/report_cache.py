@@ -0,0 +1,125 @@
+import datetime
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from store.utils.db_routing import replica_routing
+
+
+class ReportCache:
+    """
+    Report data stored under a key built from versions of the days its period covers.
+    Long periods are covered by years and months, short ones by days, so a key needs a few dozen versions.
+    A change of sales on a day replaces versions of that day, its month and its year:
+    only reports whose period covers the day get a new key, the others are still found.
+    Versions are bumped by the worker booking sales, so the cache has to be shared by every process.
+    Hits and misses are counted per process
+    """
+    all_version_key = 'report:version:all'
+    year_version_key = 'report:version:year:{:%Y}'
+    month_version_key = 'report:version:month:{:%Y-%m}'
+    day_version_key = 'report:version:day:{:%Y-%m-%d}'
+    changed_at_key = 'report:changed_at'
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def get_or_build(self, day_from, day_to, options, build):
+        """
+        Return cached data of the report for days [day_from, day_to) with options, otherwise build and cache it
+        """
+        key = self.key(day_from, day_to, options)
+        data = self.shared.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        with replica_routing.after_change(lambda: self.shared.get(self.changed_at_key)):
+            data = build()
+        self.shared.set(key, data, timeout=self.timeout)
+        return data
+
+    def key(self, day_from, day_to, options):
+        versions = self.get_versions([self.all_version_key, *self.period_version_keys(day_from, day_to)])
+        digest = hashlib.sha1(repr((day_from, day_to, sorted(options.items()), versions)).encode()).hexdigest()
+        return f'report:{digest}'
+
+    def get_versions(self, version_keys):
+        versions = self.shared.get_many(version_keys)
+        for version_key in version_keys:
+            if version_key not in versions:
+                version = uuid.uuid4().hex
+                if not self.shared.add(version_key, version, timeout=None):
+                    version = self.shared.get(version_key, version)
+                versions[version_key] = version
+        return [versions[version_key] for version_key in version_keys]
+
+    def period_version_keys(self, day_from, day_to):
+        """
+        Version keys of whole years, whole months and single days making up [day_from, day_to)
+        """
+        version_keys = []
+        day = day_from
+        while day < day_to:
+            next_year = day.replace(year=day.year + 1, month=1, day=1)
+            next_month = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+            if day.month == 1 and day.day == 1 and next_year <= day_to:
+                version_keys.append(self.year_version_key.format(day))
+                day = next_year
+            elif day.day == 1 and next_month <= day_to:
+                version_keys.append(self.month_version_key.format(day))
+                day = next_month
+            else:
+                version_keys.append(self.day_version_key.format(day))
+                day += datetime.timedelta(days=1)
+        return version_keys
+
+    def invalidate(self, days):
+        """
+        Drop cached reports covering any of the days now and once more after commit,
+        so a report read from not yet committed data does not outlive the transaction
+        """
+        version_keys = {version_key.format(day) for day in days
+                        for version_key in (self.year_version_key, self.month_version_key, self.day_version_key)}
+        self.bump_versions(version_keys)
+        transaction.on_commit(lambda: self.bump_versions(version_keys))
+
+    def invalidate_all(self):
+        self.bump_versions([self.all_version_key])
+        transaction.on_commit(lambda: self.bump_versions([self.all_version_key]))
+
+    def bump_versions(self, version_keys):
+        self.shared.set_many({**{version_key: uuid.uuid4().hex for version_key in version_keys},
+                              self.changed_at_key: time.time()}, timeout=None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+
+def check_report_cache(app_configs, **kwargs):
+    """
+    System check refusing a report cache private to one process
+    """
+    if isinstance(caches[settings.REPORT_CACHE_ALIAS], LocMemCache):
+        return [checks.Error(f"REPORT_CACHE_ALIAS '{settings.REPORT_CACHE_ALIAS}' is a local memory cache",
+                             hint='Reports are invalidated by the worker process, use a cache shared by processes',
+                             id='store.E001')]
+    return []
+
+
+report_cache = ReportCache(settings.REPORT_CACHE_ALIAS, settings.REPORT_CACHE_TIMEOUT)
@@ -1,15 +1,36 @@
 import datetime
+import itertools
 
-from django.db.models import Sum, F, Case, When
+from django.db.models import BigIntegerField, DecimalField, IntegerField, Sum, F, Case, When, Q, Value
+from django.db.models.functions import Cast, Round, TruncDay, TruncMonth, TruncWeek
 from django.utils.timezone import make_aware
 
-from store.models import OrderProduct
+from store.models import OrderProduct, DailyProductSales, line_amount
+from store.utils.cart import from_cents
+
+try:
+    import numpy
+except ImportError:  # numpy engine is optional
+    numpy = None
+
+
+def cents(field):
+    return Cast(Round(F(field) * 100), output_field=BigIntegerField())
+
+
+def sum_when(condition, value, output_field):
+    return Sum(Case(When(condition, then=value), default=Value(0), output_field=output_field))
 
 
 class Report:
     """
     Expects a date in the format 'dd.mm.YYYY'
     """
+    fields = ('product__id', 'refund_products', 'quantity_selled_products', 'proceeds', 'profit')
+    series_fields = ('product__id', 'period', 'refund_products', 'quantity_selled_products', 'proceeds', 'profit')
+    engines = ('sql', 'lines', 'numpy')
+    periods = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+    chunk_size = 100000
 
     def __init__(self, date_from, date_to):
         self.date_from, self.date_to = map(self.reformat_date, (date_from, date_to))
@@ -18,13 +39,104 @@ class Report:
     def reformat_date(self, date):
         return make_aware(datetime.datetime.strptime(date, "%d.%m.%Y"))
 
-    def get_report_products(self):
-        products_sells = OrderProduct.objects.filter(
-            order__updated__range=(self.date_from, self.date_to)).values('product__id').annotate(
-            refund_products=Sum(Case(When(order__returned=True, then='quantity'), default=0)),
-            quantity_selled_products=Sum(F('quantity')) - F('refund_products'),
-            proceeds=F('product__price') * F('quantity_selled_products'),
-            profit=F('proceeds') - (
-                    F('product__cost_price') * F('quantity_selled_products')),
-        )
+    @classmethod
+    def available_engines(cls):
+        return tuple(engine for engine in cls.engines if engine != 'numpy' or numpy is not None)
+
+    def get_report_products(self, engine='sql'):
+        """
+        Sum daily rollup rows, so the cost depends on the number of days and not on the number of orders.
+        engine='lines' computes the same report from order lines in SQL, engine='numpy' with NumPy
+        """
+        if engine == 'lines':
+            return self.get_report_products_from_orders()
+        if engine == 'numpy':
+            return self.get_report_products_numpy()
+        return self.rollup_rows().values('product__id').annotate(**self.rollup_totals()).order_by('product__id')
+
+    def get_report_series(self, group_by, top=None):
+        """
+        Report of every product per day, week or month with one query over the rollup,
+        ordered by product and period. With top only products with the highest profit for the whole period are kept
+        """
+        rows = self.rollup_rows()
+        if top is not None:
+            top_products = self.rollup_rows().values('product').annotate(
+                total_profit=Sum('proceeds') - Sum('cost')).order_by('-total_profit', 'product')
+            rows = rows.filter(product__in=top_products.values('product')[:top])
+        return rows.annotate(period=self.periods[group_by]('day')).values('product__id', 'period').annotate(
+            **self.rollup_totals()).order_by('product__id', 'period')
+
+    def rollup_rows(self):
+        return DailyProductSales.objects.filter(day__gte=self.date_from.date(), day__lt=self.date_to.date())
+
+    @staticmethod
+    def rollup_totals():
+        return {'refund_products': Sum('refunded'),
+                'quantity_selled_products': Sum('sold') - F('refund_products'),
+                'proceeds': Sum('proceeds'),
+                'profit': F('proceeds') - Sum('cost')}
+
+    def get_report_products_from_orders(self):
+        """
+        Aggregate order lines directly with the prices they were sold at, so Product is not joined.
+        Counts the same way as the rollup and is used to check the rollup against the source data
+        """
+        sold = Q(order__created__gte=self.date_from, order__created__lt=self.date_to)
+        refunded = Q(order__returned=True, order__updated__gte=self.date_from, order__updated__lt=self.date_to)
+        products_sells = OrderProduct.objects.filter(sold | refunded).values('product__id').annotate(
+            refund_products=sum_when(refunded, F('quantity'), IntegerField()),
+            quantity_selled_products=sum_when(sold, F('quantity'), IntegerField()) - F('refund_products'),
+            proceeds=(sum_when(sold, line_amount('unit_price'), DecimalField()) -
+                      sum_when(refunded, line_amount('unit_price'), DecimalField())),
+            profit=F('proceeds') - (sum_when(sold, line_amount('unit_cost'), DecimalField()) -
+                                    sum_when(refunded, line_amount('unit_cost'), DecimalField())),
+        ).order_by('product__id')
         return products_sells
+
+    def get_report_products_numpy(self):
+        """
+        Read order lines of the period as columns into NumPy arrays and sum them per product with bincount.
+        Sales are counted on the day order was created and refunds on the day it was returned, as in the rollup
+        """
+        sold = self.order_line_columns(self.sold_lines())
+        refunded = self.order_line_columns(self.refunded_lines())
+        product_ids, index = numpy.unique(numpy.concatenate([sold[0], refunded[0]]), return_inverse=True)
+        sold_index, refunded_index = index[:len(sold[0])], index[len(sold[0]):]
+
+        def per_product(lines_index, values):
+            sums = numpy.bincount(lines_index, weights=values, minlength=len(product_ids))
+            return numpy.rint(sums).astype(numpy.int64)
+
+        sold_quantity = per_product(sold_index, sold[1])
+        refunded_quantity = per_product(refunded_index, refunded[1])
+        proceeds = per_product(sold_index, sold[1] * sold[2]) - per_product(refunded_index, refunded[1] * refunded[2])
+        cost = per_product(sold_index, sold[1] * sold[3]) - per_product(refunded_index, refunded[1] * refunded[3])
+        return [{'product__id': int(product_id),
+                 'refund_products': int(refunded_quantity[position]),
+                 'quantity_selled_products': int(sold_quantity[position] - refunded_quantity[position]),
+                 'proceeds': from_cents(int(proceeds[position])),
+                 'profit': from_cents(int(proceeds[position] - cost[position]))}
+                for position, product_id in enumerate(product_ids)]
+
+    def sold_lines(self):
+        return OrderProduct.objects.filter(order__created__gte=self.date_from, order__created__lt=self.date_to)
+
+    def refunded_lines(self):
+        return OrderProduct.objects.filter(order__returned=True, order__updated__gte=self.date_from,
+                                           order__updated__lt=self.date_to)
+
+    def order_line_columns(self, lines):
+        """
+        Columns of product id, quantity, unit price and unit cost in cents of the lines, fetched in chunks
+        """
+        rows = lines.values_list('product_id', 'quantity', cents('unit_price'),
+                                 cents('unit_cost')).iterator(chunk_size=self.chunk_size)
+        chunks = []
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            chunks.append(numpy.array(chunk, dtype=numpy.int64))
+        columns = numpy.concatenate(chunks) if chunks else numpy.empty((0, 4), dtype=numpy.int64)
+        return columns.T
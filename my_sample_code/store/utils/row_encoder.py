@@ -0,0 +1,85 @@
+import decimal
+
+from django.utils.functional import cached_property
+from rest_framework import fields as serializer_fields
+from rest_framework.settings import api_settings
+
+from store.serializers import ProductSerializer
+
+
+class RowEncoder:
+    """
+    Turns values_list() rows into the dicts a serializer would make of model instances, without building them.
+    Fields are compiled once: plain text and integer columns are taken as they come from the database,
+    decimals are quantized and formatted the way DecimalField does it, other fields call their to_representation
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def compiled(self):
+        names, sources, converters = [], [], []
+        for field in self.serializer_class().fields.values():
+            if field.write_only:
+                continue
+            if len(field.source_attrs) != 1:
+                raise ValueError(f'{field.field_name} is not a column, rows can not be encoded')
+            names.append(field.field_name)
+            sources.append(field.source)
+            converter = self.converter(field)
+            if converter is not None:
+                converters.append((len(names) - 1, converter))
+        return tuple(names), tuple(sources), tuple(converters)
+
+    @property
+    def fields(self):
+        """
+        Columns to pass to values_list(), in the order encode() expects them
+        """
+        return self.compiled[1]
+
+    @staticmethod
+    def converter(field):
+        if type(field) in (serializer_fields.CharField, serializer_fields.IntegerField):
+            return None
+        if (type(field) is serializer_fields.DecimalField and field.decimal_places is not None and not field.localize
+                and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)):
+            places = field.decimal_places
+            exponent = decimal.Decimal('.1') ** places
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            longest = float('inf') if field.max_digits is None else field.max_digits + 1
+            rounding = field.rounding
+
+            def to_string(value):
+                if isinstance(value, decimal.Decimal):
+                    text = str(value)
+                    # the database returns decimals with the places of the column, quantize would not change them
+                    if text[-places - 1:-places] == '.' and len(text) <= longest:
+                        return text
+                else:
+                    value = decimal.Decimal(str(value).strip())
+                return format(value.quantize(exponent, rounding=rounding, context=context), 'f')
+            return to_string
+        return field.to_representation
+
+    def encode(self, rows):
+        """
+        Dicts of rows, columns after the encoded fields (ordering annotations) are left out
+        """
+        names, _, converters = self.compiled
+        width = len(names)
+        encoded = []
+        for row in rows:
+            values = list(row[:width])
+            for position, convert in converters:
+                value = values[position]
+                if value is not None:
+                    values[position] = convert(value)
+            encoded.append(dict(zip(names, values)))
+        return encoded
+
+
+product_rows = RowEncoder(ProductSerializer)
@@ -0,0 +1,146 @@
+import re
+from functools import reduce
+from operator import and_
+
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, Lookup, Q, TextField, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+
+SEARCH_TABLE = 'store_product_fts'
+# the triggers of migration 0009, recreated by create_search_triggers when a table rebuild dropped them
+SEARCH_TRIGGERS = {
+    'store_product_fts_insert':
+        'CREATE TRIGGER IF NOT EXISTS store_product_fts_insert AFTER INSERT ON store_product BEGIN '
+        'INSERT INTO store_product_fts (rowid, name, about_product) VALUES (new.id, new.name, new.about_product); '
+        'END',
+    'store_product_fts_delete':
+        'CREATE TRIGGER IF NOT EXISTS store_product_fts_delete AFTER DELETE ON store_product BEGIN '
+        "INSERT INTO store_product_fts (store_product_fts, rowid, name, about_product) "
+        "VALUES ('delete', old.id, old.name, old.about_product); "
+        'END',
+    'store_product_fts_update':
+        'CREATE TRIGGER IF NOT EXISTS store_product_fts_update AFTER UPDATE OF name, about_product ON store_product '
+        'BEGIN '
+        "INSERT INTO store_product_fts (store_product_fts, rowid, name, about_product) "
+        "VALUES ('delete', old.id, old.name, old.about_product); "
+        'INSERT INTO store_product_fts (rowid, name, about_product) VALUES (new.id, new.name, new.about_product); '
+        'END',
+}
+
+
+def create_search_triggers(using, **kwargs):
+    """
+    post_migrate receiver: SQLite rebuilds a table altered by a migration and drops its triggers,
+    recreate missing ones and rebuild the index, which missed the changes made without them
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or SEARCH_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'store_product'")
+        if not SEARCH_TRIGGERS.keys() - {name for name, in cursor.fetchall()}:
+            return
+        for statement in SEARCH_TRIGGERS.values():
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+class SearchDocumentField(TextField):
+    """
+    Hidden column of an FTS5 table named after the table, MATCH on it searches every indexed column
+    """
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class ProductSearch:
+    """
+    Full-text search over product name and about_product, ranked by relevance with name weighing more.
+    Postgres matches a generated tsvector column with a GIN index, SQLite an FTS5 table kept in sync
+    by triggers (migration 0009, ProductSearchIndex). Every whitespace separated term has to match, words of a term
+    as a phrase with the last one as a prefix: 'test_prod' finds 'test_product_1'.
+    Other databases fall back to icontains without ranking.
+    Only the first max_ranked matches (lowest ids) are ranked: ranking every product containing a common word
+    takes seconds on a large catalogue. The other matches are still returned after them, with unranked rank
+    """
+    rank_field = 'search_rank'
+    max_ranked = 2000
+    unranked = -1.0
+    word = re.compile(r'[^\W_]+')
+
+    def terms(self, search):
+        """
+        Words of every term, punctuation is dropped so user input never reaches the query syntax
+        """
+        terms = [self.word.findall(term) for term in search.split()]
+        return [words for words in terms if words]
+
+    def filter(self, queryset, search):
+        """
+        Products matching search annotated with search_rank (higher is better), queryset as is without terms
+        """
+        terms = self.terms(search)
+        if not terms:
+            return queryset
+        vendor = connections[queryset.db].vendor
+        if vendor == 'postgresql':
+            return self.filter_postgresql(queryset, terms)
+        if vendor == 'sqlite':
+            return self.filter_sqlite(queryset, terms)
+        return queryset.filter(reduce(and_, (Q(name__icontains=term) | Q(about_product__icontains=term)
+                                             for term in search.split()))
+                               ).annotate(**{self.rank_field: Value(0.0, output_field=FloatField())})
+
+    def filter_postgresql(self, queryset, terms):
+        query = ' & '.join(' <-> '.join([*words[:-1], f'{words[-1]}:*']) for words in terms)
+        table = queryset.model._meta.db_table
+        matches = queryset.model._base_manager.filter(RawSQL(
+            f'"{table}"."search_vector" @@ to_tsquery(\'simple\', %s)', (query,), output_field=BooleanField()))
+        rank = RawSQL(f'ts_rank("{table}"."search_vector", to_tsquery(\'simple\', %s))', (query,),
+                      output_field=FloatField())
+        ranked = matches.order_by('id').values('id')[:self.max_ranked]
+        return queryset.filter(id__in=matches.values('id')).annotate(**{self.rank_field: Case(
+            When(id__in=ranked, then=rank), default=Value(self.unranked), output_field=FloatField())})
+
+    def filter_sqlite(self, queryset, terms):
+        """
+        Ranks come from one full-text query over the FTS5 table: bm25 counts the documents matching every term,
+        which a query per product would repeat for each of them
+        """
+        query = ' '.join('"{}"*'.format(' '.join(words)) for words in terms)
+        index = queryset.model._meta.get_field('search_index').related_model
+        table, fts_table = queryset.model._meta.db_table, index._meta.db_table
+        matches = index.objects.filter(document__match=query).values('pk')
+        # FTS5 rank is bm25, lower for better matches
+        rank = RawSQL(
+            f'SELECT -matches.rank FROM (SELECT rowid, rank FROM "{fts_table}" WHERE "{fts_table}" MATCH %s LIMIT %s) '
+            f'matches WHERE matches.rowid = "{table}"."id"', (query, self.max_ranked), output_field=FloatField())
+        return queryset.filter(id__in=matches).annotate(**{self.rank_field: Coalesce(rank, Value(self.unranked))})
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    ?search= full-text search, results are ordered by relevance unless ordering is asked for
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        search = request.query_params.get(self.search_param, '')
+        searched = product_search.filter(queryset, search)
+        if searched is queryset:
+            return queryset
+        return searched.order_by(f'-{product_search.rank_field}', 'id')
+
+
+product_search = ProductSearch()
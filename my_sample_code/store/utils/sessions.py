@@ -0,0 +1,26 @@
+from django.contrib.sessions.backends import db
+
+from store.models import CartLine
+from store.utils.metrics import metrics
+
+
+class SessionStore(db.SessionStore):
+    """
+    Database session store counting bytes of session data read and written for /metrics.
+    `manage.py clearsessions` deletes cart lines of DatabaseCartStorage left by deleted sessions too.
+    Set SESSION_ENGINE = 'store.utils.sessions' to use it
+    """
+
+    @classmethod
+    def clear_expired(cls):
+        super().clear_expired()
+        CartLine.objects.purge()
+
+    def decode(self, session_data):
+        metrics.inc('session_read_bytes_total', len(session_data))
+        return super().decode(session_data)
+
+    def encode(self, session_dict):
+        session_data = super().encode(session_dict)
+        metrics.inc('session_write_bytes_total', len(session_data))
+        return session_data
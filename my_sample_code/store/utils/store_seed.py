@@ -0,0 +1,108 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from store.models import Product, Order, OrderProduct, DailyProductSales
+from store.utils.catalogue_cache import catalogue_cache
+
+
+class StoreSeedResult:
+
+    def __init__(self):
+        self.products = self.orders = self.order_lines = self.returned_orders = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {'products': self.products,
+                'orders': self.orders,
+                'order_lines': self.order_lines,
+                'returned_orders': self.returned_orders,
+                'seconds': round(self.seconds, 3)}
+
+
+class StoreSeeder:
+    """
+    Generates products and a history of orders spread over the last days with bulk inserts,
+    the same seed gives the same data. Returned orders are returned a few days after they were created.
+    The daily sales rollup of the seeded days is rebuilt at the end
+    """
+
+    def __init__(self, seed=0, batch_size=5000):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+
+    def run(self, products, orders, days=365, lines_per_order=3, refund_ratio=0.05, stock=1000):
+        result = StoreSeedResult()
+        with transaction.atomic():
+            product_prices = self.create_products(products, stock, result)
+            if product_prices and orders:
+                self.create_orders(orders, days, lines_per_order, refund_ratio, product_prices, result)
+                today = timezone.localdate()
+                DailyProductSales.objects.rebuild(today - datetime.timedelta(days=days), today)
+            catalogue_cache.invalidate()
+        result.seconds = time.perf_counter() - result.started
+        return result
+
+    def create_products(self, products, stock, result):
+        """
+        Create products with vendor codes after the highest product id, return [(id, price, cost_price)]
+        """
+        first_number = (Product.objects.aggregate(last_id=Max('id'))['last_id'] or 0) + 1
+        for start in range(0, products, self.batch_size):
+            batch = []
+            for number in range(first_number + start, first_number + min(start + self.batch_size, products)):
+                price = Decimal(self.random.randint(100, 100000)) / 100
+                batch.append(Product(name=f'seed_product_{number}', vendor_code=f'S{number}', price=price,
+                                     cost_price=(price * Decimal(self.random.uniform(0.3, 0.9))).quantize(price),
+                                     quantity=stock))
+            Product.objects.bulk_create(batch)
+            result.products += len(batch)
+        # sqlite does not return ids of bulk inserted rows
+        return list(Product.objects.filter(name__startswith='seed_product_')
+                    .order_by('-id').values_list('id', 'price', 'cost_price')[:products])
+
+    def create_orders(self, orders, days, lines_per_order, refund_ratio, product_prices, result):
+        """
+        Create orders and their lines, orders are spread evenly over the days before today
+        """
+        for start in range(0, orders, self.batch_size):
+            Order.objects.bulk_create([Order(customer_name=f'customer_{number}', email=f'customer_{number}@email.com',
+                                             address='seed street', postal_code='123456', city='seed city')
+                                       for number in range(start, min(start + self.batch_size, orders))])
+        order_ids = list(Order.objects.order_by('-id').values_list('id', flat=True)[:orders])[::-1]
+        result.orders = len(order_ids)
+
+        lines = []
+        for order_id in order_ids:
+            for product_id, price, cost_price in self.random.sample(product_prices,
+                                                                    min(lines_per_order, len(product_prices))):
+                lines.append(OrderProduct(order_id=order_id, product_id=product_id,
+                                          quantity=self.random.randint(1, 5), unit_price=price, unit_cost=cost_price))
+                if len(lines) == self.batch_size:
+                    OrderProduct.objects.bulk_create(lines)
+                    result.order_lines += len(lines)
+                    lines = []
+        OrderProduct.objects.bulk_create(lines)
+        result.order_lines += len(lines)
+
+        # created is set on insert, the history is written with one update per day
+        midnight = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        orders_per_day = -(-len(order_ids) // days)
+        for day in range(days):
+            day_order_ids = order_ids[day * orders_per_day:(day + 1) * orders_per_day]
+            if not day_order_ids:
+                break
+            created = midnight - datetime.timedelta(days=days - day, hours=-12)
+            day_orders = Order.objects.filter(id__gte=day_order_ids[0], id__lte=day_order_ids[-1])
+            day_orders.update(created=created, updated=created)
+            returned_ids = [order_id for order_id in day_order_ids if self.random.random() < refund_ratio]
+            if returned_ids:
+                returned = min(created + datetime.timedelta(days=self.random.randint(1, 7)), timezone.now())
+                day_orders.filter(id__in=returned_ids).update(returned=True, updated=returned)
+                result.returned_orders += len(returned_ids)
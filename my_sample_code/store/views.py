@@ -1,44 +1,111 @@
-from django.core.exceptions import ObjectDoesNotExist
+import os
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.db.models import QuerySet
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics
 from rest_framework import status
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import ModelViewSet
 
 from store.models import Product, Order
 from store.serializers import (ProductSerializer,
                                ProductEconomicDataSerializer,
-                               OrderSerializer
+                               OrderSerializer,
+                               OrderRefundSerializer,
+                               CartBulkSerializer,
                                )
 from store.utils.cart import Cart
+from store.utils.catalogue_cache import catalogue_cache
+from store.utils.checkout import Checkout, NothingToSellError
+from store.utils.db_routing import ReplicaReadsMixin
+from store.utils.idempotency import idempotent_responses
+from store.utils.pagination import KeysetPagination
+from store.utils.product_import import ProductImporter
+from store.utils.metrics import metrics
+from store.utils.report_cache import report_cache
+from store.utils.search import ProductSearchFilter
+from store.utils.renderers import StreamingRenderer, CSVRenderer, NDJSONRenderer, FastJSONRenderer
+from store.utils.row_encoder import product_rows
 from store.utils.reports import Report
 
 
-class ProductAPIViewSet(ModelViewSet):
+class ProductAPIViewSet(ReplicaReadsMixin, ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filter_fields = ['name', 'price', 'cost_price']
-    search_fields = ['name', 'price', 'cost_price']
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
+    filter_fields = ['name', 'vendor_code', 'price', 'cost_price']
     ordering_fields = ['name', 'price', 'cost_price']
+    renderer_classes = [FastJSONRenderer, *api_settings.DEFAULT_RENDERER_CLASSES]
+
+    def list(self, request, *args, **kwargs):
+        return catalogue_cache.respond(request, catalogue_cache.list_key(request), lambda: self.list_rows(request))
+
+    def list_rows(self, request):
+        """
+        Page of products read as values_list() rows and encoded as ProductSerializer would do it,
+        without building model instances. Annotations the page is ordered by are read too, for the cursor
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values_list(*product_rows.fields, *queryset.query.annotations, named=True)
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(product_rows.encode(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        return catalogue_cache.respond(request, catalogue_cache.product_key(kwargs['pk']),
+                                       lambda: super(ProductAPIViewSet, self).retrieve(request, *args, **kwargs))
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import', parser_classes=[MultiPartParser])
+    def import_products(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': 'No file was uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        data_format = request.data.get('data_format') or upload.name.rsplit('.', 1)[-1].lower()
+        if data_format not in ProductImporter.formats:
+            return Response({'detail': f'Unknown file format, expected one of {", ".join(ProductImporter.formats)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        upload.open('rb')
+        result = ProductImporter().run(upload.file, data_format)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
 
 
 class UpdateProductEconomicDataAPIView(generics.UpdateAPIView):
     serializer_class = ProductEconomicDataSerializer
 
     def put(self, request, *args, **kwargs):
+        if isinstance(self.request.data, list):
+            return self.put_batch(request)
         serializer = self.get_serializer(data=self.request.data)
-        product_id = self.request.data.get('id')
-        product = get_object_or_404(Product, id=product_id)
-        product.quantity = self.request.data.get('quantity')
-        product.price = self.request.data.get('price')
-        product.cost_price = self.request.data.get('cost_price')
         serializer.is_valid(raise_exception=True)
-        product.save()
+        changes = dict(serializer.validated_data)
+        product = get_object_or_404(Product.objects.only('id'), id=changes.pop('id'))
+        for field, value in changes.items():
+            setattr(product, field, value)
+        product.save(update_fields=list(changes))
         return Response(self.request.data)
 
+    def put_batch(self, request):
+        serializer = self.get_serializer(data=self.request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        product_ids = {change['id'] for change in serializer.validated_data}
+        not_found = product_ids.difference(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        if not_found:
+            return Response({'detail': 'Not found.', 'not_found_products': sorted(not_found)},
+                            status=status.HTTP_404_NOT_FOUND)
+        Product.objects.update_economic_data(serializer.validated_data)
+        return Response({'detail': 'Products updated', 'updated_products': len(product_ids)})
+
 
 class CartAPIView(generics.GenericAPIView):
 
@@ -46,26 +113,48 @@ class CartAPIView(generics.GenericAPIView):
         cart = Cart(request)
         product_id = request.data.get('product_id')
         quantity = request.data.get('quantity_to_buy')
-        product = get_object_or_404(Product, id=product_id)
-        serializer = ProductSerializer(product)
-        added_product = cart.add(product=serializer.data, quantity_to_buy=quantity)
+        product = get_object_or_404(Product.objects.only('id', 'price', 'quantity'), id=product_id)
+        added_product = cart.add(product={'id': product.id, 'quantity': product.quantity, 'price': product.price},
+                                 quantity_to_buy=quantity)
         if added_product:
             return Response({'detail': 'Product added to your cart', 'products': added_product})
         return Response({'detail': 'The quantity of the product is too large'}, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request):
-        Cart(request)
-        cart = request.session.get('cart')
-        return Response(cart, status=status.HTTP_200_OK)
+        cart = Cart(request)
+        return Response(cart.as_dict(), status=status.HTTP_200_OK)
 
     def delete(self, request):
         cart = Cart(request)
         product_id = request.data.get('product_id')
-        product = get_object_or_404(Product, id=product_id)
+        product = get_object_or_404(Product.objects.only('id'), id=product_id)
         cart.remove(product)
         return Response({'detail': 'Item removed from cart'}, status=status.HTTP_204_NO_CONTENT)
 
 
+class CartBulkAPIView(generics.GenericAPIView):
+    serializer_class = CartBulkSerializer
+    line_details = {True: 'Product added to your cart',
+                    False: 'The quantity of the product is too large',
+                    None: 'Not found.'}
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.validated_data['lines']
+        products = Product.objects.only('id', 'price', 'quantity').in_bulk([line['product_id'] for line in lines])
+        products = {product.id: {'id': product.id, 'quantity': product.quantity, 'price': product.price}
+                    for product in products.values()}
+        cart = Cart(request)
+        accepted = cart.add_many([(products.get(line['product_id']), line['quantity_to_buy']) for line in lines])
+        results = [{**line, 'accepted': bool(line_accepted), 'detail': self.line_details[line_accepted]}
+                   for line, line_accepted in zip(lines, accepted)]
+        if not any(accepted):
+            return Response({'detail': 'No product was added to your cart', 'lines': results},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': 'Products added to your cart', 'lines': results, 'products': cart.as_dict()})
+
+
 class OrderAPIView(generics.GenericAPIView):
     serializer_class = OrderSerializer
 
@@ -76,41 +165,132 @@ class OrderAPIView(generics.GenericAPIView):
         return Response({"order": serializer.data})
 
     def post(self, request):
+        return idempotent_responses.respond(request, lambda: self.create_order(request))
+
+    def patch(self, request):
+        return idempotent_responses.respond(request, lambda: self.refund(request))
+
+    def create_order(self, request):
         cart = Cart(request)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        order = serializer.save()
-        selled_products, not_selled_products = Order().add_products_from_cart_to_order(cart, order)
-        if Order().can_be_ordered(selled_products, not_selled_products):
+        stale_prices = cart.get_stale_prices()
+        try:
+            order, selled_products, not_selled_products = Checkout(cart).place_order(serializer.validated_data)
+        except NothingToSellError as error:
             return Response({'detail': 'Cant sell this quantity of selected products. Please change it',
-                             'not_selled_products': not_selled_products},
+                             'not_selled_products': error.not_selled_products},
                             status=status.HTTP_400_BAD_REQUEST)
-
-        order = serializer.save()
-        order_data = OrderSerializer(order).data
         request.session['order_id'] = order.id
         cart.clear()
         return Response({'detail': 'Order created',
-                         'order_data': order_data,
+                         'order_data': OrderSerializer(order).data,
                          'selled_products': selled_products,
-                         'not_selled_products': not_selled_products},
+                         'not_selled_products': not_selled_products,
+                         'changed_price_products': stale_prices},
                         status=status.HTTP_201_CREATED)
 
-    def patch(self, request):
+    def refund(self, request):
+        if 'order_ids' in request.data:
+            return self.bulk_refund(request)
         try:
-            Order().cancel_order(request)
-        except ObjectDoesNotExist:
+            order = Order.objects.get(id=request.data.get('order_id'))
+        except (ObjectDoesNotExist, ValueError, TypeError):
             return Response({'detail': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        order.cancel_order()
         return Response({'detail': 'Order has been returned'}, status=status.HTTP_204_NO_CONTENT)
 
+    def bulk_refund(self, request):
+        serializer = OrderRefundSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order_ids = set(serializer.validated_data['order_ids'])
+        found_order_ids = set(Order.objects.filter(id__in=order_ids).values_list('id', flat=True))
+        returned_order_ids = Order.objects.filter(id__in=found_order_ids).cancel()
+        return Response({'detail': 'Orders have been returned',
+                         'returned_orders': returned_order_ids,
+                         'already_returned_orders': sorted(found_order_ids.difference(returned_order_ids)),
+                         'not_found_orders': sorted(order_ids.difference(found_order_ids))},
+                        status=status.HTTP_200_OK)
+
 
-class ReportAPIView(generics.GenericAPIView):
+class ReportAPIView(ReplicaReadsMixin, generics.GenericAPIView):
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer, NDJSONRenderer]
+    stream_chunk_size = 2000
 
     def get(self, request):
-        date_from = request.data.get('date_from')
-        date_to = request.data.get('date_to')
+        date_from = request.data.get('date_from', request.query_params.get('date_from'))
+        date_to = request.data.get('date_to', request.query_params.get('date_to'))
+        engine = request.data.get('engine', request.query_params.get('engine', 'sql'))
+        group_by = request.data.get('group_by', request.query_params.get('group_by'))
+        top = request.data.get('top', request.query_params.get('top'))
+        engines = Report.available_engines()
+        if engine not in engines:
+            return Response({'detail': f'Unknown report engine, expected one of {", ".join(engines)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if group_by is not None:
+            if group_by not in Report.periods:
+                return Response({'detail': f'Unknown group_by, expected one of {", ".join(Report.periods)}'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if engine != 'sql':
+                return Response({'detail': 'Reports grouped by period are summed from the rollup, use engine sql'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                top = None if top is None else int(top)
+                if top is not None and top < 1:
+                    raise ValueError(top)
+            except (ValueError, TypeError):
+                return Response({'detail': 'top must be a positive number'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            products_report = Report(date_from, date_to).get_report_products()
+            report = Report(date_from, date_to)
         except (ValueError, TypeError):
             return Response({'detail': "No date range was specified"}, status=status.HTTP_400_BAD_REQUEST)
-        return Response({"products": products_report})
+        if isinstance(request.accepted_renderer, StreamingRenderer):
+            if group_by is not None:
+                return self.stream_report(report.get_report_series(group_by, top), Report.series_fields)
+            return self.stream_report(report.get_report_products(engine), Report.fields)
+        options = {'engine': engine, 'group_by': group_by, 'top': top}
+        return Response(report_cache.get_or_build(report.date_from.date(), report.date_to.date(), options,
+                                                  lambda: self.build_report(report, engine, group_by, top)))
+
+    def build_report(self, report, engine, group_by, top):
+        if group_by is None:
+            return {'products': list(report.get_report_products(engine))}
+        products = [{'product__id': product_id,
+                     'series': [{field: row[field] for field in Report.series_fields[1:]} for row in rows]}
+                    for product_id, rows in groupby(report.get_report_series(group_by, top),
+                                                    key=itemgetter('product__id'))]
+        return {'group_by': group_by, 'products': products}
+
+    def stream_report(self, products_report, fields):
+        """
+        Stream report rows while they are fetched from the database cursor, streamed reports are not cached.
+        Rows are fetched after the view returned, so the database is chosen now
+        """
+        renderer = self.request.accepted_renderer
+        if isinstance(products_report, QuerySet):
+            rows = products_report.using(products_report.db).iterator(chunk_size=self.stream_chunk_size)
+        else:
+            rows = iter(products_report)
+        return StreamingHttpResponse(renderer.stream(rows, fields),
+                                     content_type=f'{renderer.media_type}; charset={renderer.charset}')
+
+
+class ReportCacheStatsAPIView(generics.GenericAPIView):
+    """
+    Hits and misses of the report cache in the process that served the request
+    """
+
+    def get(self, request):
+        return Response({**report_cache.stats(), 'process': os.getpid()})
+
+
+class MetricsView(View):
+    """
+    Metrics of this process in Prometheus text format, served to addresses from METRICS_ALLOWED_IPS setting
+    and to staff users
+    """
+
+    def get(self, request):
+        if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+            raise PermissionDenied()
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')